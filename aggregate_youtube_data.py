@@ -1,7 +1,19 @@
+import os
+import sys
 import json
+import re
+import time
+import urllib
 import youtube_session
 import argparse
-import urlparse
+from session_reader import iter_items
+from session_index import SessionIndex
+from session_pool import SessionPool
+from session_intervals import index_session_files
+
+
+class AggregateYoutubeDataError(Exception):
+  pass
 
 
 #Reference https://www.genyoutube.net/formats-resolution-youtube-videos.html
@@ -73,7 +85,55 @@ VIDEO_QUALITY_DICT = {
   '172': 0
 }
 
-def prepare_entry(entry, ys):
+# Query parameters of the googlevideo requests kept by prepare_entry
+QUERY_PARAMS = ("itag", "range", "clen", "mime", "dur", "rbuf", "rn")
+
+
+def query_param_pattern(names):
+  """
+  :param names: the names of the query parameters
+  :return: a regex matching these parameters and their value in a query string, separated
+  by & or ; as parse_qs does
+  """
+  return re.compile(r'(?:^|[&;])(' + '|'.join(re.escape(name) for name in names) + r')=([^&;]*)')
+
+QUERY_PARAM = query_param_pattern(QUERY_PARAMS)
+
+
+def extract_query_params(url, pattern=QUERY_PARAM):
+  """
+  Reads a few parameters of the query string of a URL in a single scan, without splitting and
+  decoding the others (e.g. the signatures of googlevideo URLs)
+  :param url: the URL
+  :param pattern: a regex from query_param_pattern, by default matching QUERY_PARAMS
+  :return: dict of name -> value, the first one if a parameter is repeated. As with parse_qs,
+  parameters with an empty value are left out
+  """
+  params = {}
+  # like urlparse, the query goes from the first ? to the fragment
+  end = url.find('#')
+  if end < 0:
+    end = len(url)
+  start = url.find('?', 0, end)
+  if start < 0:
+    return params
+  for m in pattern.finditer(url[start + 1:end]):
+    name, value = m.groups()
+    if value and name not in params:
+      if '%' in value or '+' in value:
+        value = urllib.unquote_plus(value)
+      params[name] = value
+  return params
+
+
+def prepare_entry(entry, ys=None):
+  """
+  Extracts a completed googlevideo request from an entry of the web history
+  :param entry: the entry
+  :param ys: the YoutubeSession to look up the player state at the start and end of the request,
+  None to leave it to join_session
+  :return: the request, None if the entry is not a completed googlevideo request
+  """
   try:
     request = {}
     if "googlevideo" in entry["OnBeforeRequestOptions"]['url']:
@@ -87,22 +147,27 @@ def prepare_entry(entry, ys):
       request['method'] = entry["onCompleted"]['method']
       request['status'] = entry["onCompleted"]['statusCode']
       request['content-type'] = ""
-      for header in entry["onCompleted"]["responseHeaders"]:
+      # the last content-type header wins
+      for header in reversed(entry["onCompleted"]["responseHeaders"]):
         if header["name"] == 'content-type':
           request['content-type'] = header["value"]
-          continue
+          break
 
-      url = urlparse.urlparse(request['url'])
-      query = urlparse.parse_qs(url.query)
+      query = extract_query_params(request['url'])
 
-      request['itag'] = query["itag"][0]
+      request['itag'] = query["itag"]
       if request['itag'] in VIDEO_QUALITY_DICT:
         request['resolution'] = VIDEO_QUALITY_DICT[request['itag']]
       else:
         request['resolution'] = 0
 
-      request['range'] = query['range'][0]
-      request['clen'] = query['clen'][0]
+      request['range'] = query['range']
+      request['clen'] = query['clen']
+      for name in ('mime', 'dur', 'rbuf', 'rn'):
+        request[name] = query.get(name)
+
+      if ys is None:
+        return request
 
       request['download_start'] = {
         # "PS": "Normal",
@@ -140,35 +205,402 @@ def prepare_entry(entry, ys):
     # print 'Some other error:',e,'\nFor entry',val
     return None
 
-def process_session(web_history="requests_history.json", ext_file="ext.json", outfile="out.json"):
-  wh = open(web_history)
-  fn = json.load(wh)
-  wh.close()
-  ys = youtube_session.YoutubeSession(ext_file)
-  out_json ={
+def join_session(requests, ys):
+  """
+  Adds the player state at the start and end of every request, looking all of them up at once
+  :param requests: list of requests from prepare_entry
+  :param ys: the YoutubeSession
+  :return: nothing
+  """
+  times = [r['start_ts'] for r in requests] + [r['end_ts'] for r in requests]
+  found = ys.values_by_times(times)
+  n = len(requests)
+  for i, request in enumerate(requests):
+    request['download_start'] = {
+      'closest': found["timeStamps"][i],
+      'buffer': found["buffer"][i],
+      'pos': found["currentTimes"][i],
+    }
+    request['download_end'] = {
+      'closest': found["timeStamps"][n + i],
+      'buffer': found["buffer"][n + i],
+      'pos': found["currentTimes"][n + i],
+    }
+
+def iter_requests(web_history, ys, batch_size=1000):
+  """
+  Streams the googlevideo requests of the web history, joined to the player state a batch at a time
+  :param web_history: the browser request history
+  :param ys: the YoutubeSession
+  :param batch_size: number of requests looked up in the session at once
+  :return: generator of (key, request)
+  """
+  batch = []
+  # the entries are decoded one at a time, and dropped right away unless they are googlevideo requests
+  for key, value in iter_items(web_history):
+    entry = prepare_entry(value)
+    if entry is None:
+      continue
+    batch.append((key, entry))
+    if len(batch) == batch_size:
+      join_session([entry for key, entry in batch], ys)
+      for item in batch:
+        yield item
+      batch = []
+  if batch:
+    join_session([entry for key, entry in batch], ys)
+    for item in batch:
+      yield item
+
+
+def session_header(ys):
+  """
+  :return: dict of the fields describing the session in the output
+  """
+  return {
     "movie_id": ys.mid,
-    "duration": ys.duration,
+    "duration": ys.get_video_duration(),
     "startTs": ys.startTime,
     "endTs": ys.endTime,
-    "vals": {}
   }
-  for key in fn:
-    entry = prepare_entry(fn[key], ys)
-    if entry is None:
-      continue
-    out_json["vals"][key] = entry
 
+
+def write_jsonl(outfile, header, requests):
+  """
+  Writes one compact JSON record per line, the header first and then the requests as they come
+  :param outfile: the file to write
+  :param header: dict from session_header
+  :param requests: iterable of (key, request)
+  :return: number of requests written
+  """
+  n = 0
+  with open(outfile, 'w') as o:
+    record = dict(header)
+    record["record"] = "header"
+    o.write(json.dumps(record, separators=(',', ':')) + "\n")
+    for key, request in requests:
+      # the requests of the caller are left as they are
+      o.write(json.dumps(dict(request, record="request", key=key), separators=(',', ':')) + "\n")
+      n += 1
+  return n
+
+
+def iter_jsonl(filename):
+  """
+  Reads back a file written by write_jsonl one line at a time
+  :param filename: the JSON Lines output
+  :return: generator of the records, the header first
+  """
+  with open(filename, 'r') as f:
+    for line in f:
+      if line.strip():
+        yield json.loads(line)
+
+
+def write_output(outfile, header, requests, fmt="json"):
+  """
+  :param outfile: the file to write
+  :param header: dict from session_header
+  :param requests: iterable of (key, request)
+  :param fmt: "json" for a single indented document, "jsonl" to write the requests incrementally
+  :return: number of requests written
+  """
+  if fmt == "jsonl":
+    return write_jsonl(outfile, header, requests)
+
+  out_json = dict(header)
+  out_json["vals"] = dict(requests)
   o = open(outfile, 'w')
   text = json.dumps(out_json, indent=4, separators=(',', ': '))
   o.write(text)
   o.close()
+  return len(out_json["vals"])
 
 
-if __name__ == "__main__":
-  parser = argparse.ArgumentParser()
+def process_session(web_history="requests_history.json", ext_file="ext.json", outfile="out.json", fmt="json"):
+  """
+  :param web_history: the browser request history
+  :param ext_file: the extension session
+  :param outfile: the file to write
+  :param fmt: "json" for a single indented document, "jsonl" to write the requests incrementally
+  :return: number of requests written
+  """
+  ys = youtube_session.YoutubeSession(ext_file)
+  return write_output(outfile, session_header(ys), iter_requests(web_history, ys), fmt)
+
+
+def _assign(batch, index, margin, assigned):
+  """
+  Adds the requests of batch to the sessions of index they overlap
+  :return: number of requests overlapping no session
+  """
+  lows = [request['start_ts'] - margin for key, request in batch]
+  highs = [request['end_ts'] + margin for key, request in batch]
+  queries, positions = index.overlapping_many(lows, highs)
+  previous = None
+  for q, i in zip(queries, positions):
+    key, request = batch[q]
+    # join_session adds to the requests, so a request shared by several sessions is copied
+    if q == previous:
+      request = dict(request)
+    previous = q
+    assigned.setdefault(index.items[i], []).append((key, request))
+  return len(batch) - len(set(queries))
+
+
+def split_history(web_history, index, margin=0, batch_size=1000):
+  """
+  Assigns every googlevideo request of the web history to the sessions it overlaps in time, in one pass
+  :param web_history: the browser request history
+  :param index: IntervalIndex of the extension sessions, see session_intervals.index_session_files
+  :param margin: time in ms by which the requests are widened before being matched
+  :param batch_size: number of requests matched at once
+  :return: a tuple (dict of session -> list of (key, request), number of requests overlapping no session)
+  """
+  assigned = {}
+  unmatched = 0
+  batch = []
+  for key, value in iter_items(web_history):
+    entry = prepare_entry(value)
+    if entry is None:
+      continue
+    batch.append((key, entry))
+    if len(batch) == batch_size:
+      unmatched += _assign(batch, index, margin, assigned)
+      batch = []
+  if batch:
+    unmatched += _assign(batch, index, margin, assigned)
+  return assigned, unmatched
+
+
+def process_history(web_history, ext_files, out_dir=".", fmt="json", margin=0, folder=None):
+  """
+  Splits a web history spanning many sessions among the extension files it overlaps, and writes
+  the requests of every session joined to its player state
+  :param web_history: the browser request history
+  :param ext_files: the YouTube extension files, only their headers are read to match the requests
+  :param out_dir: the folder of the outputs
+  :param fmt: "json" or "jsonl"
+  :param margin: time in ms by which the requests are widened before being matched
+  :param folder: the outputs mirror the tree below this folder, None to name them after the extension files only
+  :return: dict of extension file -> number of requests written
+  """
+  index, unreadable = index_session_files(ext_files)
+  assigned, unmatched = split_history(web_history, index, margin)
+  written = {}
+  failed = []
+  for ext_file in sorted(assigned):
+    requests = assigned.pop(ext_file)
+    try:
+      ys = youtube_session.YoutubeSession(ext_file)
+    except Exception as e:
+      # the header was read but not the entries, the other sessions are still written
+      failed.append((ext_file, "%s: %s" % (type(e).__name__, e)))
+      continue
+    join_session([request for key, request in requests], ys)
+    outfile = output_path(ext_file, out_dir, fmt, folder)
+    if os.path.dirname(outfile) and not os.path.isdir(os.path.dirname(outfile)):
+      os.makedirs(os.path.dirname(outfile))
+    written[ext_file] = write_output(outfile, session_header(ys), requests, fmt)
+
+  print "Matched", sum(written.values()), "requests to", len(written), "of", len(index), "sessions,", \
+    unmatched, "requests overlap no session"
+  if unreadable:
+    print "Not possible to read the header of", len(unreadable), "files:"
+    for filename in sorted(unreadable):
+      print " ", filename
+  if failed:
+    print "Not possible to parse", len(failed), "youtube files:"
+    for filename, error in failed:
+      print " ", filename, "because", error
+  return written
+
+
+def output_path(ext_file, out_dir, fmt, folder=None):
+  """
+  :param ext_file: the extension session
+  :param out_dir: the folder of the outputs
+  :param fmt: "json" or "jsonl"
+  :param folder: the outputs mirror the tree below this folder, None to name them after ext_file only
+  :return: the output file of ext_file
+  """
+  if folder is None:
+    rel = os.path.basename(ext_file)
+  else:
+    rel = os.path.relpath(ext_file, folder)
+  return os.path.join(out_dir, os.path.splitext(rel)[0] + "." + fmt)
+
+
+def read_manifest(filename, out_dir, fmt):
+  """
+  Reads the pairs to process, one "web_history ext_file [outfile]" per line. Relative paths are
+  taken from the folder of the manifest, empty lines and lines starting with # are ignored
+  :param filename: the manifest
+  :param out_dir: the folder of the outputs not given by the manifest
+  :param fmt: "json" or "jsonl"
+  :return: list of (web history, extension file, output file)
+  """
+  base = os.path.dirname(os.path.abspath(filename))
+  pairs = []
+  try:
+    with open(filename, 'r') as f:
+      for number, line in enumerate(f, 1):
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+          continue
+        if len(fields) not in (2, 3):
+          raise AggregateYoutubeDataError("Line %d of %s should be: web_history ext_file [outfile]" % (number, filename))
+        web, ext = [os.path.join(base, path) for path in fields[:2]]
+        if len(fields) == 3:
+          out = os.path.join(base, fields[2])
+        else:
+          out = output_path(ext, out_dir, fmt)
+        pairs.append((web, ext, out))
+  except IOError as e:
+    raise AggregateYoutubeDataError("Cannot read manifest " + filename + ": " + str(e))
+  return pairs
+
+
+def discover_pairs(folder, out_dir, fmt, web_name="requests_history.json", recursive=True):
+  """
+  Pairs every YouTube extension file of the tree with the web history of its folder
+  :param folder: the folder to walk
+  :param out_dir: the folder of the outputs, mirroring the tree of folder
+  :param fmt: "json" or "jsonl"
+  :param web_name: the name of the web history files
+  :param recursive: walk the whole tree rather than the date folders only
+  :return: list of (web history, extension file, output file), the extension files without a web
+  history next to them are left out
+  """
+  pairs = []
+  for f in SessionIndex(folder, recursive=recursive).select(sessiontype='y'):
+    web = os.path.join(os.path.dirname(f.path), web_name)
+    if os.path.isfile(web):
+      pairs.append((web, f.path, output_path(f.path, out_dir, fmt, folder)))
+  return pairs
+
+
+def process_pair(pair, fmt="json"):
+  """
+  Worker of process_batch
+  :param pair: a tuple (web history, extension file, output file)
+  :return: number of requests written
+  """
+  web, ext, out = pair
+  folder = os.path.dirname(out)
+  if folder and not os.path.isdir(folder):
+    try:
+      os.makedirs(folder)
+    except OSError:
+      # created by another worker in the meantime
+      if not os.path.isdir(folder):
+        raise
+  return process_session(web_history=web, ext_file=ext, outfile=out, fmt=fmt)
+
+
+def process_batch(pairs, fmt="json", pool=None, summary=None):
+  """
+  Processes many pairs in this process or a pool of workers, so that the interpreter
+  starts and the modules are imported only once
+  :param pairs: list of (web history, extension file, output file)
+  :param fmt: "json" or "jsonl"
+  :param pool: the SessionPool processing the pairs, by default one at a time in this process
+  :param summary: JSON file receiving the outcome of every pair, None to only print the totals
+  :return: list of dicts with the web, ext and out files of every pair and either its number of
+  requests or its error
+  """
+  if pool is None:
+    pool = SessionPool()
+  started = time.time()
+  outcomes = []
+  for pair, n in pool.map(process_pair, pairs, (fmt,)):
+    outcomes.append({"web": pair[0], "ext": pair[1], "out": pair[2], "requests": n})
+  failed = [{"web": pair[0], "ext": pair[1], "out": pair[2], "error": error} for pair, error in pool.errors]
+  pool.errors = []
+  elapsed = time.time() - started
+
+  print "Processed", len(outcomes), "of", len(pairs), "pairs,", sum(o["requests"] for o in outcomes), \
+    "requests in %.1f s" % elapsed
+  if failed:
+    print "Not possible to process", len(failed), "pairs:"
+    for outcome in sorted(failed, key=lambda o: o["ext"]):
+      print " ", outcome["ext"], "because", outcome["error"]
+  outcomes.extend(failed)
+  if summary is not None:
+    with open(summary, 'w') as f:
+      json.dump({"pairs": len(pairs), "failed": len(failed), "seconds": elapsed, "outcomes": outcomes}, f, indent=2)
+  return outcomes
+
+
+def batch_main(argv):
+  parser = argparse.ArgumentParser(prog="aggregate_youtube_data.py batch")
+  source = parser.add_mutually_exclusive_group(required=True)
+  source.add_argument('-m', '--manifest', type=str, help="file listing web_history ext_file [outfile] per line")
+  source.add_argument('-d', '--folder', type=str, help="folder where the pairs are discovered")
+  parser.add_argument('-o', '--out-dir', type=str, default=".", help="folder of the outputs")
+  parser.add_argument('-f', '--format', type=str, choices=["json", "jsonl"], default="json", help="output format")
+  parser.add_argument('--web-name', type=str, default="requests_history.json",
+                      help="name of the web history files next to the extension files")
+  parser.add_argument('-r', '--recursive', action='store_true', help="recursive in folders")
+  parser.add_argument('-j', '--jobs', type=int, default=1, help="number of processes")
+  parser.add_argument('--timeout', type=int, default=None, help="seconds allowed per pair")
+  parser.add_argument('--memory-limit', type=int, default=None, help="memory limit of each process in MB")
+  parser.add_argument('-s', '--summary', type=str, default=None, help="JSON file receiving the outcome of every pair")
+  args = vars(parser.parse_args(argv))
+
+  if args['manifest'] is not None:
+    pairs = read_manifest(args['manifest'], args['out_dir'], args['format'])
+  else:
+    pairs = discover_pairs(args['folder'], args['out_dir'], args['format'], web_name=args['web_name'],
+                           recursive=args['recursive'])
+  memory_limit = None
+  if args['memory_limit'] is not None:
+    memory_limit = args['memory_limit'] << 20
+  pool = SessionPool(jobs=args['jobs'], timeout=args['timeout'], memory_limit=memory_limit)
+  process_batch(pairs, fmt=args['format'], pool=pool, summary=args['summary'])
+
+
+def join_main(argv):
+  parser = argparse.ArgumentParser(prog="aggregate_youtube_data.py join")
+  parser.add_argument('-w', '--web', type=str, required=True, help="web history file")
+  sessions = parser.add_mutually_exclusive_group(required=True)
+  sessions.add_argument('-e', '--ext', type=str, nargs='+', help="extension files")
+  sessions.add_argument('-d', '--folder', type=str, help="folder of the extension files")
+  parser.add_argument('-r', '--recursive', action='store_true', help="recursive in folders")
+  parser.add_argument('-o', '--out-dir', type=str, default=".", help="folder of the outputs")
+  parser.add_argument('-f', '--format', type=str, choices=["json", "jsonl"], default="json", help="output format")
+  parser.add_argument('--margin', type=int, default=0, help="ms by which the requests are widened before matching")
+  args = vars(parser.parse_args(argv))
+
+  if args['ext'] is not None:
+    ext_files = args['ext']
+  else:
+    ext_files = [f.path for f in SessionIndex(args['folder'], recursive=args['recursive']).select(sessiontype='y')]
+  process_history(args['web'], ext_files, out_dir=args['out_dir'], fmt=args['format'], margin=args['margin'],
+                  folder=args['folder'])
+
+
+SUBCOMMANDS = {
+  "batch": batch_main,
+  "join": join_main,
+}
+
+
+def main():
+  if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+    SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
+    return
+
+  parser = argparse.ArgumentParser(epilog="run with batch or join as first argument to process many sessions at once")
   parser.add_argument('-w', '--web', type=str, required=True, help="web history file")
   parser.add_argument('-e', '--ext', type=str, required=True, help="extension file")
   parser.add_argument('-o', '--out', type=str, required=True, help="outfile file")
+  parser.add_argument('-f', '--format', type=str, choices=["json", "jsonl"], default="json",
+                      help="json writes one indented document, jsonl one compact record per request as it is produced")
   args = vars(parser.parse_args())
 
-  process_session(web_history=args["web"], ext_file=args["ext"], outfile=args["out"])
\ No newline at end of file
+  process_session(web_history=args["web"], ext_file=args["ext"], outfile=args["out"], fmt=args["format"])
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,59 @@
+import json
+import argparse
+import timeit
+import urlparse
+from aggregate_youtube_data import extract_query_params, QUERY_PARAMS
+
+
+def load_urls(filename):
+  """
+  :param filename: an output of aggregate_youtube_data, e.g. test.json
+  :return: list of the URLs of its requests
+  """
+  with open(filename, 'r') as f:
+    out = json.load(f)
+  return [request["url"] for request in out["vals"].values() if "url" in request]
+
+
+def parse_qs_params(url):
+  """
+  Reference extraction, splitting and decoding the whole query string
+  """
+  query = urlparse.parse_qs(urlparse.urlparse(url).query)
+  return dict((name, query[name][0]) for name in QUERY_PARAMS if name in query)
+
+
+def bench(function, urls, repeat):
+  """
+  :return: the best time per URL in microseconds over repeat runs
+  """
+  timer = timeit.Timer(lambda: [function(url) for url in urls])
+  return min(timer.repeat(repeat, 1)) / len(urls) * 1e6
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-f', '--file', type=str, default="test.json", help="requests written by aggregate_youtube_data")
+  parser.add_argument('-n', '--copies', type=int, default=100, help="number of times every URL is parsed per run")
+  parser.add_argument('-r', '--repeat', type=int, default=5, help="number of runs, the best one is reported")
+  args = vars(parser.parse_args())
+
+  urls = load_urls(args['file'])
+  if not urls:
+    print "No URLs in", args['file']
+    return
+  for url in urls:
+    if extract_query_params(url) != parse_qs_params(url):
+      print "Extracted parameters differ from parse_qs for", url
+      return
+  urls = urls * args['copies']
+  reference = bench(parse_qs_params, urls, args['repeat'])
+  targeted = bench(extract_query_params, urls, args['repeat'])
+  print "URLs:", len(urls), "average length:", sum(len(url) for url in urls) / len(urls)
+  print "urlparse + parse_qs: %.2f us per request" % reference
+  print "extract_query_params: %.2f us per request" % targeted
+  print "speedup: %.1fx" % (reference / targeted)
+
+
+if __name__ == '__main__':
+  main()
@@ -1,5 +1,9 @@
-import json
+import copy
 from collections import OrderedDict
+import numpy as np
+from session_columns import Column, RangeTable, EventIndex, value_at, sample_range, NEAREST
+from session_schema import Field, SessionSchema, FILL_DEFAULT, non_empty
+from session_reader import SessionReader, SessionReaderError
 
 # YPR: available video rates ["hd2160","hd1440","hd1080","hd720","large","medium","small","tiny","auto"]
 # BUF: rangesToString(video.buffered),
@@ -56,10 +60,29 @@ from collections import OrderedDict
 class GeneralSessionError(Exception):
   pass
 
+
 class GeneralSession:
 
   TS_GRANULARITY = 500
 
+  # Ranges are kept as strings while decoding and parsed all at once afterwards
+  SCHEMA = SessionSchema([
+    Field("ts", int, Column("timeStamps", np.float64), required=True),
+    Field("BUF", non_empty, Column("buffer", object, default=None)),
+    Field("VHE", int, Column("videoHeights", np.int16)),
+    Field("VWI", int, Column("videoWidths", np.int16)),
+    Field("CUT", float, Column("currentTimes", np.float64)),
+    Field("RST", int, Column("readyStates", np.int8)),
+    Field("WVD", int, Column("webkitVideoDecodedByteCount", np.int64)),
+    Field("DUR", int, Column("durations", np.int32), missing=FILL_DEFAULT, invalid=FILL_DEFAULT,
+          errors=(TypeError,)),
+    Field("PLA", non_empty, Column("played", object, default=None), missing=FILL_DEFAULT),
+  ])
+  # Per-sample columns, sliced together when the session is trimmed
+  SAMPLE_COLUMNS = ("timeStamps", "readyStates", "buffer", "bufferDurations", "bufferedPosition", "currentTimes",
+                    "position", "videoWidths", "videoHeights", "videoRates", "resolution", "durations",
+                    "webkitAudioDecodedByteCount", "webkitVideoDecodedByteCount")
+
   def __init__(self, filename = None):
     """
     Initialize empty stats structure
@@ -73,6 +96,7 @@ class GeneralSession:
     self.readyStates = []
     self.buffer = []
     self.bufferDurations = []
+    self.bufferedPosition = []
     self.currentTimes = []
     self.position = []
     self.videoWidths = []
@@ -83,11 +107,15 @@ class GeneralSession:
     self.webkitVideoDecodedByteCount = []
     self.events = []
     self.eventsTimeStamps = []
+    self.eventIndex = EventIndex([], [])
     self.bitrateChanges = []
     self.stalls = []
     self.joinTime = 0
     self.version = None
     self.isAborted = False
+    self.truncated = False
+    self.malformedBuffers = []
+    self.malformedPlayed = []
     if filename is not None:
       self.processed_succesfully = self.process_youtube_session(filename)
     else:
@@ -100,34 +128,31 @@ class GeneralSession:
     :param filename: the JSON file to parse
     :return: the parsed
     """
+    if filename is not None:
+      self.filename = filename
+    reader = SessionReader(self.filename)
     try:
-      if filename is not None:
-        self.filename = filename
-      with open(self.filename, 'r') as f:
-        string = f.read()
-        f.close()
-      dataset = json.loads(string)
-    except Exception as e:
-      raise GeneralSessionError("Bad JSON file: " + e.message)
-    try:
+      columns, _ = GeneralSession.SCHEMA.decode(self.split_events(reader.entries()), compact=False)
+      self.truncated = reader.truncated
+      dataset = reader.header
       self.startTime = float(dataset["st"])
       self.endTime = float(dataset["et"])
       if "v" in dataset:
         self.version = dataset["v"]
       self.mid = dataset["mid"]
-
-      for entry in dataset["vals"]:
-        ts = int(entry["ts"]) - self.startTime
-        if not self.add_event(entry, ts):
-          self.timeStamps.append(ts)
-          self.add_buffer(entry)
-          self.add_video_height(entry)
-          self.add_video_width(entry)
-          self.add_currentTime_video(entry)
-          self.add_ready_state(entry)
-          self.add_decoded_video_bytes(entry)
-          self.add_duration(entry)
-          self.add_join_time(entry, ts)
+      rawTimeStamps = columns["timeStamps"].astype(np.int64).tolist()
+      columns["timeStamps"] -= self.startTime
+      self.eventsTimeStamps = [ts - self.startTime for ts in self.eventsTimeStamps]
+      self.index_events()
+      self.buffer, malformed = RangeTable.from_strings(columns.pop("buffer"), default=[(0, 0)])
+      self.malformedBuffers = columns["timeStamps"][malformed].tolist()
+      played, malformed = RangeTable.from_strings(columns.pop("played"), fill_previous=False)
+      self.malformedPlayed = columns["timeStamps"][malformed].tolist()
+      playedDurations = played.first_lengths()
+      self.set_columns(columns)
+      self.videoHeights = zip(rawTimeStamps, self.videoHeights)
+      self.videoWidths = zip(rawTimeStamps, self.videoWidths)
+      self.add_join_time(playedDurations)
       self.add_video_rates()
       self.add_buffer_durations()
       self.throw_last_video()
@@ -136,46 +161,44 @@ class GeneralSession:
       self.gen_empty_buffers()
       return True
 
+    except (IOError, SessionReaderError) as e:
+      raise GeneralSessionError("Bad JSON file: " + str(e))
     except KeyError as ke:
       raise GeneralSessionError("Bad JSON file: " + ke.message)
 
-  def add_video_height(self, entry):
-    try:
-      h = int(entry["VHE"])
-      self.videoHeights.append((entry['ts'], h))
-    except KeyError:
-      if len(self.videoHeights) > 0:
-        self.videoHeights.append((entry['ts'], self.videoHeights[-1][1]))
-      else:
-        self.videoHeights.append((entry['ts'], 0))
-    except ValueError as e:
-      if len(self.videoHeights) > 0:
-        self.videoHeights.append((entry['ts'], self.videoHeights[-1][1]))
-      else:
-        self.videoHeights.append((entry['ts'], 0))
 
+  def split_events(self, entries):
+    """
+    Records the player events, with absolute timestamps, and yields the other entries,
+    which are the samples
+    :param entries: the entries of the session file
+    :return: generator of sample entries
+    """
+    for entry in entries:
+      ts = int(entry["ts"])
+      if "EVE" not in entry:
+        yield entry
+        continue
+      try:
+        event = int(entry["EVE"])
+        self.events.append(event)
+        self.eventsTimeStamps.append(ts)
+      except ValueError as e:
+        print 'Error when parsing an event: ' + e.message
+
+  def set_columns(self, columns):
+    """
+    Stores decoded columns on the session, as lists
+    :param columns: dict of column name -> array
+    :return: nothing
+    """
+    for name, values in columns.items():
+      setattr(self, name, values.tolist())
 
   def get_video_heights(self):
     return self.videoHeights
 
 
-  def add_video_width(self, entry):
-    try:
-      w = int(entry["VWI"])
-      self.videoWidths.append((entry['ts'], w))
-    except KeyError:
-      if len(self.videoWidths) > 0:
-        self.videoWidths.append((entry['ts'], self.videoWidths[-1][1]))
-      else:
-        self.videoWidths.append((entry['ts'], 0))
-    except ValueError as e:
-      print 'Error while parsing video width: ' + e.message
-      if len(self.videoWidths) > 0:
-        self.videoWidths.append((entry['ts'], self.videoWidths[-1][1]))
-      else:
-        self.videoWidths.append((entry['ts'], 0))
-
-
   def get_video_widths(self):
     return self.videoWidths
 
@@ -206,38 +229,28 @@ class GeneralSession:
         self.videoRates.append(0)
 
 
-  def add_currentTime_video(self, entry):
-    try:
-      ct = float(entry["CUT"])
-      self.currentTimes.append(ct)
-    except KeyError:
-      if len(self.currentTimes) == 0:
-        self.currentTimes.append(0)
-      else:
-        self.currentTimes.append(self.currentTimes[-1])
-    except ValueError as e:
-      if len(self.currentTimes) == 0:
-        self.currentTimes.append(0)
-      else:
-        self.currentTimes.append(self.currentTimes[-1])
-
+  def value_by_time(self, values, t, mode=NEAREST):
+    """
+    Looks up a column at time t by binary search on the timestamps of the samples
+    :param values: the column, e.g. self.timeStamps
+    :param t: absolute time, on the scale of startTime
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
+    :return: the value, None if t is more than one sampling period away from the samples
+    """
+    return value_at(self.timeStamps, values, t - self.startTime, mode, GeneralSession.TS_GRANULARITY)
 
   def get_currentTimes_video(self):
     return self.currentTimes
 
-  def get_currentTimes_by_time(self, t):
+  def get_currentTimes_by_time(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/500)
-    if i >= len(self.currentTimes):
-      return None
-    return self.currentTimes[i]
+    return self.value_by_time(self.currentTimes, t, mode)
 
 
   def get_currentTimes_by_index(self, i):
@@ -254,34 +267,18 @@ class GeneralSession:
     return self.videoRates
 
 
-  def add_duration(self, entry):
-    try:
-      h = int(entry["DUR"])
-      self.durations.append(h)
-    except TypeError:
-      self.durations.append(0)
-      return None
-    except KeyError:
-      self.durations.append(0)
-      return None
-
-
   def get_durations(self):
     return self.durations
 
-  def get_duration_by_time(self, t):
+  def get_duration_by_time(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/500)
-    if i >= len(self.currentTimes):
-      return None
-    return self.durations[i]
+    return self.value_by_time(self.durations, t, mode)
 
 
   def get_duration_by_index(self, i):
@@ -294,53 +291,18 @@ class GeneralSession:
     return self.durations[i]
 
 
-  def add_buffer(self, entry):
-    try:
-      bufferE = entry["BUF"]
-      if not bufferE:
-        raise KeyError()
-
-      if self.version is not None:
-        buffer = bufferE[2:-2]
-      else:
-        buffer = bufferE[2:-1]
-      parts = buffer.split('},{')
-
-      buffer = []
-      for part in parts:
-        bounds = part.split(',')
-        beginning = float(bounds[0][2:])
-        end = float(bounds[1][2:])
-        buffer.append((beginning, end))
-      self.buffer.append(buffer)
-    except KeyError as e:
-      if len(self.buffer) == 0:
-        self.buffer.append([(0, 0)])
-      else:
-        self.buffer.append(self.buffer[-1])
-    except ValueError as e:
-      if len(self.buffer) == 0:
-        self.buffer.append([(0, 0)])
-      else:
-        self.buffer.append(self.buffer[-1])
-
-
   def get_buffer(self):
     return self.buffer
 
-  def get_buffer_by_time(self, t):
+  def get_buffer_by_time(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/500)
-    if i >= len(self.buffer):
-      return None
-    return self.buffer[i]
+    return self.value_by_time(self.buffer, t, mode)
 
 
   def get_buffer_by_index(self, i):
@@ -354,32 +316,35 @@ class GeneralSession:
 
 
   def add_buffer_durations(self):
-    for i in range(len(self.buffer)):
-      dur = None
-      for bufferPart in self.buffer[i]:
-        start = bufferPart[0]
-        end = bufferPart[1]
-        if start <= self.currentTimes[i] <= end:
-          dur = end - self.currentTimes[i]
-          self.bufferDurations.append(dur)
-          break
-      if dur is None:
-        maxEnd = max(self.buffer[i], key=lambda tup: tup[1])[1]
-        self.bufferDurations.append(maxEnd - self.currentTimes[i])
-
-      #self.bufferDurations.append(dur if dur >= 0 else 0)
+    """
+    Computes the buffer ahead of the current time of every sample: up to the end of the buffered
+    range holding it, or up to the furthest buffered range if it is not buffered
+    :return: nothing
+    """
+    durations, self.bufferedPosition = self.buffer.forward_lengths(self.currentTimes)
+    self.bufferDurations = durations.tolist()
 
 
   def get_buffer_durations(self):
     return self.bufferDurations
 
 
+  def get_buffering_flags(self, threshold=0):
+    """
+    :param threshold: seconds of buffer ahead at or below which playback is starved
+    :return: boolean array, True for the samples that are buffering: starved or at a position outside
+    the buffered ranges
+    """
+    durations = np.asarray(self.bufferDurations, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+      starved = ~(durations > threshold)
+    return starved | ~np.asarray(self.bufferedPosition, dtype=bool)
+
   def check_if_buffering(self):
-    bufferEvents = []
-    for i in range(len(self.buffer)):
-      if self.bufferDurations[i] == 0 or not (self.buffer[i][0] <= self.currentTimes[i] <= self.buffer[i][1]):
-        bufferEvents.append(i)
-    return bufferEvents
+    """
+    :return: list of the indices of the samples that are buffering
+    """
+    return np.flatnonzero(self.get_buffering_flags()).tolist()
 
 
   def get_timestamps(self):
@@ -390,33 +355,25 @@ class GeneralSession:
     """
     return self.timeStamps
 
-  def get_timestamp_by_time(self, t):
+  def get_timestamp_by_time(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/500)
-    if i >= len(self.timeStamps):
-      return None
-    return self.timeStamps[i]
+    return self.value_by_time(self.timeStamps, t, mode)
 
-  def get_timestamp_by_time_s(self, t):
+  def get_timestamp_by_time_s(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime*1000)/GeneralSession.TS_GRANULARITY)
-    if i >= len(self.timeStamps):
-      return None
-    return self.timeStamps[i]
+    return value_at(self.timeStamps, self.timeStamps, t - self.startTime*1000, mode, GeneralSession.TS_GRANULARITY)
 
 
   def get_timestamp_by_index(self, i):
@@ -453,19 +410,15 @@ class GeneralSession:
     """
     return self.resolution
 
-  def get_resolution_by_time(self, t):
+  def get_resolution_by_time(self, t, mode=NEAREST):
     """
 
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/GeneralSession.TS_GRANULARITY)
-    if i >= len(self.resolution):
-      return None
-    return self.resolution[i]
+    return self.value_by_time(self.resolution, t, mode)
 
   def get_resolution_by_index(self, i):
     """
@@ -476,90 +429,103 @@ class GeneralSession:
     """
     return self.resolution[i]
 
-  def add_event(self, entry, ts):
-    try:
-      event = int(entry["EVE"])
-      self.events.append(event)
-      self.eventsTimeStamps.append(ts)
-      return True
-    except KeyError:
-      return False
-    except ValueError as e:
-      print 'Error when parsing an event: ' + e.message
-      return True
-
-
-  def add_ready_state(self, entry):
-    try:
-      rst = int(entry["RST"])
-      self.readyStates.append(rst)
-    except KeyError:
-      if len(self.readyStates) == 0:
-        self.readyStates.append(0)
-      else:
-        self.readyStates.append(self.readyStates[-1])
-    except ValueError as e:
-      if len(self.readyStates) == 0:
-        self.readyStates.append(0)
-      else:
-        self.readyStates.append(self.readyStates[-1])
-
   def get_ready_states(self):
     return self.readyStates
 
-  def add_decoded_video_bytes(self, entry):
-    try:
-      decVidBytes = int(entry["WVD"])
-      self.webkitVideoDecodedByteCount.append(decVidBytes)
-    except KeyError:
-      if (len(self.webkitVideoDecodedByteCount) == 0):
-        self.webkitVideoDecodedByteCount.append(0)
-      else:
-        self.webkitVideoDecodedByteCount.append(self.webkitVideoDecodedByteCount[-1])
-    except ValueError as e:
-      if (len(self.webkitVideoDecodedByteCount) == 0):
-        self.webkitVideoDecodedByteCount.append(0)
-      else:
-        self.webkitVideoDecodedByteCount.append(self.webkitVideoDecodedByteCount[-1])
-
   def get_decoded_video_bytes(self):
     return self.webkitVideoDecodedByteCount
 
   def get_abort_event_index(self):
     try:
-      abortIdx = self.events.index(1)
-      if self.timeStamps[abortIdx] - self.timeStamps[0] <= 20 and abortIdx < len(self.events) - 1:
+      abortIdx = self.eventIndex.first_event(1)
+      if abortIdx >= 0 and self.timeStamps[abortIdx] - self.timeStamps[0] <= 20 and abortIdx < len(self.events) - 1:
         return abortIdx
       else:
         return -1
-    except:
+    except Exception:
       return -1
 
   def get_buffer_change_index(self, start):
-    for i in range(start, len(self.buffer) - 1):
-      if self.buffer[i] != self.buffer[i + 1]:
-        return i + 1
-    return -1
+    return self.buffer.next_change(start)
 
   def throw_last_video(self):
+    """
+    Drops the samples and events of the video played before an abort
+    :return: nothing
+    """
     abortIdx = self.get_abort_event_index()
     if abortIdx >= 0:
       bCIdx = self.get_buffer_change_index(abortIdx + 1)
       #TODO make sure that you do it proportionally to time
       if bCIdx >= 0:
-        self.timeStamps = self.timeStamps[bCIdx:]
-        self.readyStates = self.readyStates[bCIdx:]
-        self.buffer = self.buffer[bCIdx:]
-        self.bufferDurations = self.bufferDurations[bCIdx:]
-        self.currentTimes = self.currentTimes[bCIdx:]
-        self.position = self.position[bCIdx:]
-        self.videoWidths = self.videoWidths[bCIdx:]
-        self.videoHeights = self.videoHeights[bCIdx:]
-        self.videoRates = self.videoRates[bCIdx:]
-        self.resolution = self.resolution[bCIdx:]
-        self.webkitAudioDecodedByteCount = self.webkitAudioDecodedByteCount[bCIdx:]
-        self.webkitVideoDecodedByteCount = self.webkitVideoDecodedByteCount[bCIdx:]
-        self.events = self.events[bCIdx:]
+        self.slice_events(self.timeStamps[bCIdx], None)
+        self.slice_samples(bCIdx)
+
+  def slice_samples(self, start, stop=None):
+    """
+    Restricts every per-sample column to the samples start:stop. Arrays and RangeTables are
+    sliced as views, so in columnar mode this takes constant time and memory; lists are copied.
+    :param start: index of the first sample kept
+    :param stop: index after the last sample kept, None for the end
+    :return: nothing
+    """
+    n = len(self.timeStamps)
+    for name in GeneralSession.SAMPLE_COLUMNS:
+      values = getattr(self, name)
+      if len(values) == n:
+        setattr(self, name, values[start:stop])
+
+  def slice_events(self, low, high):
+    """
+    Restricts the events to the period [low, high)
+    :param low: relative time of the first event kept, None for no lower bound
+    :param high: relative time after the last event kept, None for no upper bound
+    :return: nothing
+    """
+    start, stop = sample_range(self.eventsTimeStamps, low, high)
+    self.events = self.events[start:stop]
+    self.eventsTimeStamps = self.eventsTimeStamps[start:stop]
+    self.index_events()
+
+  def index_events(self):
+    """
+    Builds the index of the events by code, to be called whenever the events change
+    :return: nothing
+    """
+    self.eventIndex = EventIndex(self.events, self.eventsTimeStamps)
+
+  def first_event(self, code, after=None):
+    """
+    :param code: the event code, e.g. 13 when playback starts
+    :param after: relative time from which events are considered, None for the first event
+    :return: the position of the first event of code at or after time after, -1 if there is none
+    """
+    return self.eventIndex.first_event(code, after)
+
+  def events_between(self, codes, t0=None, t1=None):
+    """
+    :param codes: an event code or a collection of codes
+    :param t0: relative time of the first event, None for no lower bound
+    :param t1: relative time of the end of the period, excluded, None for no upper bound
+    :return: list of the positions of the events of codes in [t0, t1), in order
+    """
+    return self.eventIndex.events_between(codes, t0, t1).tolist()
+
+  def window(self, start_ts, end_ts):
+    """
+    :param start_ts: absolute time of the beginning of the window, on the scale of startTime
+    :param end_ts: absolute time of the end of the window, excluded
+    :return: a copy of the session restricted to the samples, events, bitrate changes and stalls
+    starting in the window. In columnar mode its columns are views of the columns of this session.
+    """
+    low = start_ts - self.startTime
+    high = end_ts - self.startTime
+    session = copy.copy(self)
+    session.slice_samples(*sample_range(self.timeStamps, low, high))
+    session.slice_events(low, high)
+    session.bitrateChanges = [c for c in self.bitrateChanges if low <= c["ts"] < high]
+    session.stalls = [stall for stall in self.stalls if low <= stall["start"] < high]
+    return session
 
 
   def gen_bitrate_changes(self):
@@ -587,38 +553,28 @@ class GeneralSession:
 
   def gen_empty_buffers(self):
     """
-    Goes through the buffer sizes and returns empty instances
+    Builds the stalls from the events, each one going from a waiting event (22) to the
+    next playing event (13), or to the end of the session
     :return:
     """
-    started = False
-    current_stall = None
-    for index in range(len(self.events)):
-      if not started and self.events[index] == 12:
-        started = True
-        continue
-      elif self.events[index] == 13:
-        if current_stall is not None:
-          # Close current stall
-          current_stall["end"] = self.eventsTimeStamps[index]
-          self.stalls.append(current_stall)
-          current_stall = None
-      elif self.events[index] == 22:
-        if current_stall is None:
-          current_stall = {"start": self.eventsTimeStamps[index],
-                           "end": 0}
-    if current_stall is not None:
-      current_stall["end"] = self.endTime
-      self.stalls.append(current_stall)
+    index = self.eventIndex
+    start = index.next_event(22)
+    while start >= 0:
+      end = index.next_event(13, start)
+      self.stalls.append({"start": self.eventsTimeStamps[start],
+                          "end": self.eventsTimeStamps[end] if end >= 0 else self.endTime})
+      if end < 0:
+        break
+      start = index.next_event(22, end)
 
   def gen_join_time(self):
     '''
 
     :return:
     '''
-    for index in range(len(self.events)):
-      if self.events[index] == 13:
-        self.joinTime = self.eventsTimeStamps[index]
-        break
+    index = self.eventIndex.first_event(13)
+    if index >= 0:
+      self.joinTime = self.eventsTimeStamps[index]
 
 
   def get_bitrate_changes(self):
@@ -651,30 +607,14 @@ class GeneralSession:
           if i == len(self.videoHeights) - 1 or ts < self.videoHeights[i + 1][0]:
             return self.videoHeights[i][1]
 
-
-  def add_join_time(self, entry, ts):
-      try:
-        if self.joinTime > 0:
-            return
-        pla = entry["PLA"]
-        if not pla:
-          raise KeyError()
-
-        if self.version is not None:
-          buffer = pla[2:-2]
-        else:
-          buffer = pla[2:-1]
-        parts = buffer.split('},{')
-
-        buffer = []
-        bounds = parts[0].split(',')
-        beginning = float(bounds[0][2:])
-        end = float(bounds[1][2:])
-
-        if end - beginning > 0:
-            self.joinTime = ts - (end*1000 - beginning*1000)
-
-      except KeyError as e:
-        pass
-      except ValueError as e:
-        pass
+  def add_join_time(self, playedDurations):
+    """
+    Estimates the join time from the played ranges, in case no playing event is found
+    :param playedDurations: length of the first played range of every sample, 0 if unknown
+    :return: nothing
+    """
+    played = np.flatnonzero(playedDurations > 0)
+    joinTimes = np.asarray(self.timeStamps)[played] - playedDurations[played] * 1000
+    if len(joinTimes) > 0:
+      positive = joinTimes[joinTimes > 0]
+      self.joinTime = float(positive[0] if len(positive) > 0 else joinTimes[-1])
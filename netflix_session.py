@@ -1,5 +1,9 @@
-import json
-from collections import OrderedDict
+import numpy as np
+from session_columns import Column, RunLengthColumn, RecordList, as_runs, value_at, value_changes, periods, \
+  change_records, NEAREST
+from session_schema import Field, SessionSchema, FILL_DEFAULT, resolve_columns
+from session_reader import SessionReader, SessionReaderError
+from session_cache import SessionCacheError
 
 
 #     "ts":                               "ts",
@@ -43,14 +47,142 @@ from collections import OrderedDict
 class NetflixSessionError(Exception):
   pass
 
+
+def stall_runs(runs, stalled):
+  """
+  Bounds of the stalls of a run-length column. The first sample out of a stall is skipped, so
+  a stall open since the start of the session goes on up to the next sample, through the
+  following stall if that sample starts one
+  :param runs: a RunLengthColumn
+  :param stalled: boolean array, True for the runs of the stalled values
+  :return: a tuple (start indexes, stop indexes) of the stalls, a stop equal to the number of
+  samples stands for the end of the session
+  """
+  waiting = np.flatnonzero(stalled)
+  starts = runs.starts[waiting]
+  stops = runs.stops()[waiting]
+  if len(waiting) and waiting[0] == 0 and len(stalled) > 1:
+    skipped = stops[0]
+    if len(waiting) > 1 and starts[1] == skipped + 1:
+      starts, stops = np.delete(starts, 1), np.delete(stops, 0)
+    else:
+      stops[0] = skipped + 1
+  return starts, stops
+
+
+def parse_number_pair(value, parse=float):
+  """
+  Parses an "audio / video" entry
+  :return: a tuple (audio, video)
+  """
+  pair = value.strip().split("/")
+  return parse(pair[0].strip()), parse(pair[1].strip())
+
+
+def parse_buffering_bitrate(value):
+  """
+  Parses a buffering bitrate entry ("96 / 910")
+  :return: the total bitrate, 0 if unknown
+  """
+  value = value.strip()
+  if value == "?":
+    return 0
+  pair = value.split("/")
+  return float(pair[0].strip()) + float(pair[1].strip())
+
+
+def parse_playing_bitrate(value):
+  """
+  Parses a playing bitrate entry ("96 / 910 (853x480)"), which also carries the resolution
+  :return: a tuple (total bitrate, [width, height]), the resolution is None if unknown
+  """
+  stripped = value.strip()
+  if stripped == "?":
+    bitrate = 0
+  else:
+    pair = stripped.split("/")
+    bitrate = float(pair[0].strip()) + float(pair[1].strip().split("(")[0])
+  if "?" in value or "(" not in value:
+    return bitrate, None
+  res = value[value.find("(")+1:value.find(")")].split("x")
+  return bitrate, [int(res[0]), int(res[1])]
+
+
+def parse_resolution(value):
+  """
+  Parses a resolution entry ("1920/1080")
+  :return: [width, height]
+  """
+  res = value.strip().split("/")
+  return [int(res[0]), int(res[1])]
+
+
+def parse_ready_state(value):
+  """
+  Extracts the readyState from a VideoDiag entry
+  :return: the ready state
+  """
+  for el in value.split(','):
+    if el.startswith('readyState'):
+      return int(el.split('=')[1])
+  raise ValueError("No readyState in VideoDiag")
+
+
 class NetflixSession:
   TS_GRANULARITY = 1000
 
-  def __init__(self, filename = None):
+  RESOLUTION = Column("resolution", np.int16, width=2)
+  SCHEMA = SessionSchema([
+    Field("ts", int, Column("timeStamps", np.int64), required=True),
+    Field("Pos", lambda v: float(v.strip()), Column("position", np.float32), invalid=FILL_DEFAULT),
+    Field("BBR", parse_buffering_bitrate, Column("bufferingBitrate", np.float32), errors=()),
+    Field("PBR", parse_playing_bitrate, [Column("playingBitrate", np.float32), RESOLUTION], errors=()),
+    Field("Res", parse_resolution, RESOLUTION, errors=()),
+    Field("BB1", lambda v: parse_number_pair(v, int),
+          [Column("audioBufferSize", np.int32), Column("videoBufferSize", np.int32)], invalid=FILL_DEFAULT),
+    Field("BSe", parse_number_pair,
+          [Column("audioBufferSizeSeconds", np.float32), Column("videoBufferSizeSeconds", np.float32)],
+          invalid=FILL_DEFAULT),
+    Field("Th", int, Column("throughput", np.int32), invalid=FILL_DEFAULT, errors=(ValueError, TypeError)),
+    Field("RS", lambda v: v.strip(), Column("rendState", None, default="", categorical=True),
+          missing=FILL_DEFAULT),
+    Field("VD", parse_ready_state, Column("readyStates", np.int8), invalid=FILL_DEFAULT),
+  ])
+  # Piecewise-constant columns, stored as runs in columnar mode
+  RUN_LENGTH_COLUMNS = ("bufferingBitrate", "playingBitrate", "resolution", "readyStates", "rendState")
+  # Fields other than the columns saved in the parse cache
+  STATE_FIELDS = ("startTime", "endTime", "mid", "shortcutTime", "version", "esn", "userAgent",
+                  "truncated", "joinTime")
+  # Detected periods and changes, saved in the parse cache as structured arrays
+  RECORD_FIELDS = ("bitrateChanges", "stalls", "stalls_from_buffer")
+  # Attributes computed on their first access, by the method filling them
+  DERIVED = {"bitrateChanges": "gen_bitrate_changes", "stalls": "gen_empty_buffers",
+             "stalls_from_buffer": "gen_empty_buffers_from_buffer", "joinTime": "gen_join_time"}
+  # Columns and attributes every derived attribute is computed from
+  DEPENDENCIES = {"bitrateChanges": ("bufferingBitrate",), "stalls": ("readyStates",),
+                  "stalls_from_buffer": ("videoBufferSize", "position"), "joinTime": ("rendState", "position")}
+  # Columns decoded whatever the projection
+  ALWAYS = ("timeStamps",)
+
+  def __init__(self, filename = None, columnar=False, cache=None, fields=None):
     """
     Initialize empty stats structure
-    :return:
-    """
+    :param filename: the JSON file to parse
+    :param columnar: store the per-sample metrics in typed NumPy arrays instead of lists.
+    rendState then holds integer codes into rendStateCategories
+    :param cache: a SessionCache to load the parsed session from, or to store it in
+    :param fields: the columns and derived attributes needed, only the columns they are computed
+    from are decoded. None decodes every column. Sessions parsed with a projection read the cache
+    but are not stored in it
+    :return:
+    """
+    self.columnar = columnar
+    self.projection = None
+    if fields is not None:
+      self.projection = resolve_columns(fields, NetflixSession.DEPENDENCIES, NetflixSession.ALWAYS)
+      unknown = self.projection - set(column.name for column in NetflixSession.SCHEMA.columns)
+      if unknown:
+        raise NetflixSessionError("Unknown fields: " + ", ".join(sorted(unknown)))
     self.startTime = 0
     self.endTime = 0
     self.mid = ""
@@ -64,6 +196,7 @@ class NetflixSession:
     self.playingBitrate = []
     self.bufferingBitrate = []
     self.rendState = []
+    self.rendStateCategories = None
     self.videoBufferSize = []
     self.audioBufferSize = []
     self.videoBufferSizeSeconds = []
@@ -71,66 +204,182 @@ class NetflixSession:
     self.resolution = []
     self.readyStates = []
     self.throughput = []
-    self.bitrateChanges = []
-    self.stalls = []
-    self.stalls_from_buffer = []
-    self.joinTime = 0
+    self.truncated = False
     if filename is not None:
       self.filename = filename
-      self.processed_succesfully = self.process_netflix_session()
+      self.processed_succesfully = self.process_netflix_session(cache=cache)
     else:
       raise NetflixSessionError("Unparsable JSON file")
 
-  def process_netflix_session(self, filename=None):
+  def __getattr__(self, name):
+    """
+    Computes a derived attribute on its first access, it is then stored on the session
+    """
+    method = NetflixSession.DERIVED.get(name)
+    if method is None:
+      raise AttributeError(name)
+    if self.projection is not None and not self.projection.issuperset(
+        resolve_columns([name], NetflixSession.DEPENDENCIES)):
+      raise NetflixSessionError(name + " depends on columns that were not parsed")
+    getattr(self, method)()
+    return self.__dict__[name]
+
+  def invalidate(self, names=None):
+    """
+    Drops derived attributes so that they are computed again on their next access, to be
+    called after changing the columns they are computed from
+    :param names: the attributes to drop, by default all the derived ones
+    :return: nothing
+    """
+    for name in names or NetflixSession.DERIVED:
+      self.__dict__.pop(name, None)
+
+  def process_netflix_session(self, filename=None, cache=None):
     """
     Function that gets a json file and return it parsed into an
     :param filename: the JSON file to parse
+    :param cache: a SessionCache to load the parsed session from, or to store it in
     :return: the parsed
     """
+    if filename is not None:
+      self.filename = filename
+    if cache is not None and self.load_cached(cache):
+      return True
+    reader = SessionReader(self.filename)
     try:
-      if filename is not None:
-        self.filename = filename
-      with open(self.filename, 'r') as f:
-        string = f.read()
-        f.close()
-      dataset = json.loads(string, object_pairs_hook=OrderedDict)
-    except Exception as e:
-      try:
-        string = string + "\"}]}"
-        dataset = json.loads(string, object_pairs_hook=OrderedDict)
-      except Exception as e:
-        raise NetflixSessionError("Bad JSON file: " + e.message)
-    try:
+      first = reader.first_entry()
+      if first is None:
+        raise IndexError("No entries in the session")
+      self.version = first["V"]
+      self.esn = first["ESN"]
+      self.userAgent = first["UA"]
+      columns, categories = self.schema().decode(reader.entries(), compact=self.columnar)
+      self.truncated = reader.truncated
+      dataset = reader.header
       self.startTime = int(dataset["st"])
       self.mid = dataset["mid"]
       self.shortcutTime = int(dataset["sct"])
       self.endTime = int(dataset["et"])
-      self.version = dataset["vals"][0]["V"]
-      self.esn = dataset["vals"][0]["ESN"]
-      self.userAgent= dataset["vals"][0]["UA"]
-      for entry in dataset["vals"]:
-        self.timeStamps.append(int(entry["ts"]) - self.startTime)
-        self.add_position(entry)
-        self.add_buffering_bitrate(entry)
-        self.add_playing_bitrate(entry)
-        self.add_buffer_size(entry)
-        self.add_buffer_size_seconds(entry)
-        self.add_resolution(entry)
-        self.add_throughput(entry)
-        self.add_renderingstate(entry)
-        self.add_readyState(entry)
-      self.gen_bitrate_changes()
-      self.gen_empty_buffers()
-      self.gen_join_time()
+      columns["timeStamps"] -= self.startTime
+      self.set_columns(columns, categories)
+      if cache is not None and self.projection is None:
+        self.store_cached(cache)
       return True
 
+    except (IOError, SessionReaderError) as e:
+      raise NetflixSessionError("Bad JSON file: " + str(e))
     except KeyError as ke:
       raise NetflixSessionError("Parsing error: KeyError: " + str(ke.message))
     except IndexError as ie:
       raise NetflixSessionError("Parsing error: IndexError: " + str(ie.message))
+    except MemoryError:
+      raise
     except Exception as e:
       raise NetflixSessionError("Parsing error: Exception:" + str(e.message))
 
+  def set_columns(self, columns, categories):
+    """
+    Stores decoded columns on the session, as arrays or runs in columnar mode and as lists otherwise
+    :param columns: dict of column name -> array
+    :param categories: dict of categorical column name -> labels
+    :return: nothing
+    """
+    for name, values in columns.items():
+      if self.columnar and name in NetflixSession.RUN_LENGTH_COLUMNS:
+        setattr(self, name, RunLengthColumn.encode(values))
+      elif self.columnar:
+        setattr(self, name, values)
+      elif name in categories:
+        labels = categories[name]
+        setattr(self, name, [labels[code] for code in values])
+      else:
+        setattr(self, name, values.tolist())
+    if self.columnar and "rendState" in categories:
+      self.rendStateCategories = categories["rendState"]
+
+  def schema(self):
+    """
+    :return: the schema decoding the columns of the projection of the session
+    """
+    if self.projection is None:
+      return NetflixSession.SCHEMA
+    return NetflixSession.SCHEMA.project(self.projection)
+
+  def cache_kind(self):
+    """
+    :return: the key of the session type and storage mode in the parse cache
+    """
+    return "NetflixSession:" + ("columnar" if self.columnar else "lists")
+
+  def load_cached(self, cache):
+    """
+    Restores the session from the parse cache
+    :param cache: a SessionCache
+    :return: True on a hit
+    """
+    cached = cache.load(self.filename, self.cache_kind())
+    if cached is None:
+      return False
+    columns, fields = cached
+    categories = fields.pop("categories")
+    # JSON gives back unicode labels, the empty label of the missing states is a str when parsed
+    for labels in categories.values():
+      labels[0] = ""
+    for name, value in fields.items():
+      setattr(self, name, value)
+    self.bitrateChanges = change_records(columns.pop("bitrateChanges"))
+    self.stalls = RecordList(columns.pop("stalls"))
+    self.stalls_from_buffer = RecordList(columns.pop("stalls_from_buffer"))
+    self.set_columns(columns, categories)
+    return True
+
+  def store_cached(self, cache):
+    """
+    Saves the parsed session to the parse cache. The cache is best effort, failing to
+    write to it does not fail the parsing.
+    :param cache: a SessionCache
+    :return: nothing
+    """
+    columns = dict((name, getattr(self, name).records) for name in NetflixSession.RECORD_FIELDS)
+    fields = dict((name, getattr(self, name)) for name in NetflixSession.STATE_FIELDS)
+    fields["categories"] = {}
+    for column in NetflixSession.SCHEMA.columns:
+      values = getattr(self, column.name)
+      if column.categorical:
+        if self.columnar:
+          labels = self.rendStateCategories
+        else:
+          labels = [""] + sorted(set(values) - set([""]))
+          codes = dict((label, code) for code, label in enumerate(labels))
+          values = [codes[value] for value in values]
+        fields["categories"][column.name] = labels
+      columns[column.name] = np.asarray(values, dtype=column.storage_dtype(self.columnar))
+    try:
+      cache.store(self.filename, self.cache_kind(), columns, fields)
+    except SessionCacheError:
+      pass
+
+  def get_rendering_state_code(self, state):
+    """
+    :param state: a rendering state label, e.g. "Playing"
+    :return: the value representing state in rendState, or None if it never occurs
+    """
+    if self.rendStateCategories is None:
+      return state
+    if state in self.rendStateCategories:
+      return self.rendStateCategories.index(state)
+    return None
+
+  def value_by_time(self, values, t, mode=NEAREST):
+    """
+    Looks up a column at time t by binary search on the timestamps of the samples
+    :param values: the column, e.g. self.timeStamps
+    :param t: absolute time, on the scale of startTime
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
+    :return: the value, None if t is more than one sampling period away from the samples
+    """
+    return value_at(self.timeStamps, values, t - self.startTime, mode, NetflixSession.TS_GRANULARITY)
+
   def get_timestamps(self):
     """
     Temp
@@ -139,19 +388,15 @@ class NetflixSession:
     """
     return self.timeStamps
 
-  def get_timestamp_by_time(self, t):
+  def get_timestamp_by_time(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/NetflixSession.TS_GRANULARITY)
-    if i >= len(self.timeStamps):
-      return None
-    return self.timeStamps[i]
+    return self.value_by_time(self.timeStamps, t, mode)
 
 
   def get_timestamp_by_index(self, i):
@@ -163,25 +408,6 @@ class NetflixSession:
     """
     return self.timeStamps[i]
 
-  def add_position(self, entry):
-    """
-    Parses a buffering bitrate entry from the file
-    :param entry:
-    :return: nothing
-    """
-    try:
-      pos = entry["Pos"]
-      pos = pos.strip()
-      self.position.append(float(pos))
-    except ValueError as verr:
-      self.position.append(0)
-    except KeyError:
-      if len(self.position) > 0:
-        self.position.append(self.position[len(self.position) - 1])
-      else:
-        self.position.append(0)
-
-
   def get_positions(self):
     """
     Temp
@@ -190,19 +416,15 @@ class NetflixSession:
     """
     return self.position
 
-  def get_position_by_time(self, t):
+  def get_position_by_time(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/NetflixSession.TS_GRANULARITY)
-    if i >= len(self.position):
-      return None
-    return self.position[i]
+    return self.value_by_time(self.position, t, mode)
 
 
   def get_position_by_index(self, i):
@@ -214,27 +436,6 @@ class NetflixSession:
     """
     return self.position[i]
 
-  def add_buffering_bitrate(self, entry):
-    """
-    Parses a buffering bitrate entry from the file
-    :param entry:
-    :return: nothing
-    """
-    try:
-      bb2 = entry["BBR"]
-      bb2 = bb2.strip()
-      if bb2 == "?":
-        self.bufferingBitrate.append(0)
-      else:
-        bb2 = bb2.split("/")
-        self.bufferingBitrate.append(float(bb2[0].strip()) + float(bb2[1].strip()))
-
-    except KeyError:
-      if len(self.bufferingBitrate) > 0:
-        self.bufferingBitrate.append(self.bufferingBitrate[len(self.bufferingBitrate) - 1])
-      else:
-        self.bufferingBitrate.append(0)
-
   def get_buffering_bitrates(self):
     """
     Temp
@@ -243,19 +444,15 @@ class NetflixSession:
     """
     return self.bufferingBitrate
 
-  def get_buffering_bitrate_by_time(self, t):
+  def get_buffering_bitrate_by_time(self, t, mode=NEAREST):
     """
 
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/NetflixSession.TS_GRANULARITY)
-    if i >= len(self.bufferingBitrate):
-      return None
-    return self.bufferingBitrate[i]
+    return self.value_by_time(self.bufferingBitrate, t, mode)
 
   def get_buffering_bitrate_by_index(self, i):
     """
@@ -266,45 +463,6 @@ class NetflixSession:
     """
     return self.bufferingBitrate[i]
 
-  def add_playing_bitrate(self, entry):
-    """
-    Parses a playing bitrate entry from the file
-    :param entry:
-    :return: nothing
-    """
-    try:
-      bb1 = entry["PBR"]
-      bb1 = bb1.strip()
-      if bb1 == "?":
-        self.playingBitrate.append(0)
-      else:
-        bb1 = bb1.split("/")
-        self.playingBitrate.append(float(bb1[0].strip()) + float(bb1[1].strip().split("(")[0]))
-    except KeyError:
-      if len(self.playingBitrate) > 0:
-        self.playingBitrate.append(self.playingBitrate[len(self.playingBitrate) - 1])
-      else:
-        self.playingBitrate.append(0)
-
-  def add_readyState(self, entry):
-    try:
-      videoDiag = entry["VD"]
-      info = videoDiag.split(',')
-      value = None
-      for el in info:
-        if el.startswith('readyState'):
-          value = int(el.split('=')[1])
-          self.readyStates.append(value)
-      if value is None:
-        raise ValueError()
-    except ValueError as verr:
-      self.readyStates.append(0)
-    except KeyError:
-      if len(self.readyStates) > 0:
-        self.readyStates.append(self.readyStates[-1])
-      else:
-        self.readyStates.append(0)
-
   def get_playing_bitrates(self):
     """
     Temp
@@ -313,19 +471,15 @@ class NetflixSession:
     """
     return self.playingBitrate
 
-  def get_playing_bitrate_by_time(self, t):
+  def get_playing_bitrate_by_time(self, t, mode=NEAREST):
     """
 
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/NetflixSession.TS_GRANULARITY)
-    if i >= len(self.playingBitrate):
-      return None
-    return self.playingBitrate[i]
+    return self.value_by_time(self.playingBitrate, t, mode)
 
   def get_playing_bitrate_by_index(self, i):
     """
@@ -336,52 +490,6 @@ class NetflixSession:
     """
     return self.playingBitrate[i]
 
-  def add_buffer_size(self, entry):
-    """
-    Parses a buffering bitrate entry from the file
-    :param entry:
-    :return: nothing
-    """
-    try:
-      bb1 = entry["BB1"]
-      bb1 = bb1.strip()
-      bb1 = bb1.split("/")
-      self.audioBufferSize.append(int(bb1[0].strip()))
-      self.videoBufferSize.append(int(bb1[1].strip()))
-    except ValueError as verr:
-      self.videoBufferSize.append(0)
-      self.audioBufferSize.append(0)
-    except KeyError:
-      if len(self.videoBufferSize) > 0:
-        self.videoBufferSize.append(self.videoBufferSize[-1])
-        self.audioBufferSize.append(self.audioBufferSize[-1])
-      else:
-        self.videoBufferSize.append(0)
-        self.audioBufferSize.append(0)
-
-  def add_buffer_size_seconds(self, entry):
-    """
-    Parses a buffering bitrate in seconds entry from the file
-    :param entry:
-    :return: nothing
-    """
-    try:
-      bb1 = entry["BSe"]
-      bb1 = bb1.strip()
-      bb1 = bb1.split("/")
-      self.audioBufferSizeSeconds.append(float(bb1[0].strip()))
-      self.videoBufferSizeSeconds.append(float(bb1[1].strip()))
-    except ValueError as verr:
-      self.videoBufferSizeSeconds.append(0)
-      self.audioBufferSizeSeconds.append(0)
-    except KeyError:
-      if len(self.videoBufferSizeSeconds) > 0:
-        self.videoBufferSizeSeconds.append(self.videoBufferSizeSeconds[-1])
-        self.audioBufferSizeSeconds.append(self.audioBufferSizeSeconds[-1])
-      else:
-        self.videoBufferSizeSeconds.append(0)
-        self.audioBufferSizeSeconds.append(0)
-
   def get_video_buffer_sizes(self):
     """
     Temp
@@ -390,19 +498,15 @@ class NetflixSession:
     """
     return self.videoBufferSize
 
-  def get_video_buffer_size_by_time(self, t):
+  def get_video_buffer_size_by_time(self, t, mode=NEAREST):
     """
 
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/NetflixSession.TS_GRANULARITY)
-    if i >= len(self.videoBufferSize):
-      return None
-    return self.videoBufferSize[i]
+    return self.value_by_time(self.videoBufferSize, t, mode)
 
   def get_video_buffer_size_by_index(self, i):
     """
@@ -421,19 +525,15 @@ class NetflixSession:
     """
     return self.videoBufferSizeSeconds
 
-  def get_video_buffer_size_seconds_by_time(self, t):
+  def get_video_buffer_size_seconds_by_time(self, t, mode=NEAREST):
     """
 
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/NetflixSession.TS_GRANULARITY)
-    if i >= len(self.videoBufferSize):
-      return None
-    return self.videoBufferSizeSeconds[i]
+    return self.value_by_time(self.videoBufferSizeSeconds, t, mode)
 
   def get_video_buffer_size_seconds_by_index(self, i):
     """
@@ -452,19 +552,15 @@ class NetflixSession:
     """
     return self.audioBufferSize
 
-  def get_audio_buffer_size_by_time(self, t):
+  def get_audio_buffer_size_by_time(self, t, mode=NEAREST):
     """
 
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/NetflixSession.TS_GRANULARITY)
-    if i >= len(self.audioBufferSize):
-      return None
-    return self.audioBufferSize[i]
+    return self.value_by_time(self.audioBufferSize, t, mode)
 
   def get_audio_buffer_size_by_index(self, i):
     """
@@ -483,19 +579,15 @@ class NetflixSession:
     """
     return self.audioBufferSizeSeconds
 
-  def get_audio_buffer_size_seconds_by_time(self, t):
+  def get_audio_buffer_size_seconds_by_time(self, t, mode=NEAREST):
     """
 
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/NetflixSession.TS_GRANULARITY)
-    if i >= len(self.audioBufferSizeSeconds):
-      return None
-    return self.audioBufferSizeSeconds[i]
+    return self.value_by_time(self.audioBufferSizeSeconds, t, mode)
 
   def get_audio_buffer_size_seconds_by_index(self, i):
     """
@@ -506,35 +598,6 @@ class NetflixSession:
     """
     return self.audioBufferSizeSeconds[i]
 
-  def add_resolution(self, entry):
-    """
-    Parses a resolution entry from the file
-    :param entry:
-    :return: nothing
-    """
-    try:
-      if "Res" in entry.keys():
-        res = entry["Res"]
-        res = res.strip()
-        res = res.split("/")
-        self.resolution.append([res[0],res[1]])
-      elif "PBR" in entry.keys() and "?" not in entry["PBR"]:
-        s = entry["PBR"]
-        # print s
-        res = s[s.find("(")+1:s.find(")")].split("x")
-        # print res
-        self.resolution.append([res[0], res[1]])
-      else:
-        if len(self.resolution) > 0:
-          self.resolution.append(self.resolution[len(self.resolution) - 1])
-        else:
-          self.resolution.append([0, 0])
-    except KeyError:
-      if len(self.resolution) > 0:
-        self.resolution.append(self.resolution[len(self.resolution) - 1])
-      else:
-        self.resolution.append([0,0])
-
   def get_resolutions(self):
     """
     Temp
@@ -543,19 +606,15 @@ class NetflixSession:
     """
     return self.resolution
 
-  def get_resolution_by_time(self, t):
+  def get_resolution_by_time(self, t, mode=NEAREST):
     """
 
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/NetflixSession.TS_GRANULARITY)
-    if i >= len(self.resolution):
-      return None
-    return self.resolution[i]
+    return self.value_by_time(self.resolution, t, mode)
 
   def get_resolution_by_index(self, i):
     """
@@ -566,21 +625,6 @@ class NetflixSession:
     """
     return self.resolution[i]
 
-  def add_throughput(self, entry):
-    """
-    Parses a throughput entry from the file
-    :param entry:
-    :return: nothing
-    """
-    try:
-      th = entry["Th"]
-      self.throughput.append(int(th))
-    except (ValueError, TypeError) as verr:
-      self.throughput.append(0)
-    except KeyError:
-      self.throughput.append(self.throughput[-1] if len(self.throughput) > 0 else 0)
-
-
   def get_throughput(self):
     """
     Temp
@@ -589,19 +633,15 @@ class NetflixSession:
     """
     return self.throughput
 
-  def get_throughput_by_time(self, t):
+  def get_throughput_by_time(self, t, mode=NEAREST):
     """
 
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/NetflixSession.TS_GRANULARITY)
-    if i >= len(self.throughput):
-      return None
-    return self.throughput[i]
+    return self.value_by_time(self.throughput, t, mode)
 
   def get_throughput_by_index(self, i):
     """
@@ -612,41 +652,23 @@ class NetflixSession:
     """
     return self.throughput[i]
 
-  def add_renderingstate(self, entry):
-    """
-    Parses a buffering bitrate entry from the file
-    :param entry:
-    :return: nothing
-    """
-    try:
-      rs = entry["RS"]
-      rs = rs.strip()
-      self.rendState.append(rs)
-    except KeyError:
-      self.rendState.append("")
-
-
   def get_renderingstate(self):
     """
     Temp
     :param self:
     :return:
     """
-    return self.position
+    return self.rendState
 
-  def get_renderingstate_by_time(self, t):
+  def get_renderingstate_by_time(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/NetflixSession.TS_GRANULARITY)
-    if i >= len(self.position):
-      return None
-    return self.position[i]
+    return self.value_by_time(self.rendState, t, mode)
 
 
   def get_renderingstate_by_index(self, i):
@@ -656,94 +678,67 @@ class NetflixSession:
     :param i:
     :return:
     """
-    return self.position[i]
+    return self.rendState[i]
 
   def gen_bitrate_changes(self):
     """
-    Goes through the buffering bitrates and tracks eventual changes over time
-    :return:
-    """
-    started = False
-    for index in range(len(self.bufferingBitrate)):
-      if index == 0:
-        continue
-      if not started and self.bufferingBitrate[index] > 0:
-        started = True
-        continue
-      if self.bufferingBitrate[index] > self.bufferingBitrate[index-1]:
-        self.bitrateChanges.append({"ts": self.get_timestamp_by_index(index),
-                                    "direction": "up",
-                                    "previous": self.bufferingBitrate[index-1],
-                                    "new": self.bufferingBitrate[index]})
-      elif self.bufferingBitrate[index] < self.bufferingBitrate[index-1]:
-        self.bitrateChanges.append({"ts": self.get_timestamp_by_index(index),
-                                    "direction": "down",
-                                    "previous": self.bufferingBitrate[index-1],
-                                    "new": self.bufferingBitrate[index]})
+    Goes through the buffering bitrates and tracks eventual changes over time, which are the
+    boundaries of the runs of the bitrate once it is first positive
+    :return:
+    """
+    runs = as_runs(self.bufferingBitrate)
+    positive = np.flatnonzero((runs.values > 0) & (runs.stops() > 1))
+    started = max(int(runs.starts[positive[0]]), 1) if len(positive) else len(runs)
+    self.bitrateChanges = change_records(value_changes(self.timeStamps, runs, runs.starts > started))
 
   def gen_empty_buffers_from_buffer(self):
     """
-    Goes through the buffer sizes and returns empty instances. Skips the first entries at 0
-    :return:
-    """
-    started = False
-    current_stall = None
-    for index in range(len(self.videoBufferSize)):
-      if not started and self.videoBufferSize[index] > 0:
-        started = True
-        continue
-      elif self.videoBufferSize[index] != 0:
-        if current_stall is not None:
-          #Close current stall
-          current_stall["end"] = self.get_timestamp_by_index(index) - 1 - \
-                                 (self.get_position_by_index(index) - self.get_position_by_index(index - 1))
-          self.stalls.append(current_stall)
-          current_stall = None
-      else:
-        if current_stall is None:
-          current_stall = {"start": self.get_timestamp_by_index(index) - 1 -
-                                    (self.get_position_by_index(index) - self.get_position_by_index(index - 1)),
-                           "end": 0}
-    if current_stall is not None:
-      current_stall["end"] = self.endTime
-      self.stalls.append(current_stall)
+    Goes through the buffer sizes and returns empty instances, the runs of an empty video
+    buffer. Stalls are taken to start when the position stopped advancing, one sample period
+    before the buffer is seen empty.
+    :return:
+    """
+    runs = as_runs(self.videoBufferSize)
+    starts, stops = stall_runs(runs, runs.values == 0)
+    position = np.asarray(self.position, dtype=np.float64)
+    times = np.asarray(self.timeStamps, dtype=np.float64) - 1 - (position - np.roll(position, 1))
+    times = np.append(times, self.endTime)
+    self.stalls_from_buffer = RecordList(periods(times[starts], times[stops]))
 
   def gen_empty_buffers(self):
     """
-    Goes through the buffer sizes and returns empty instances. Skips the first entries at 0
-    :return:
-    """
-    started = False
-    current_stall = None
-    for index in range(len(self.readyStates)):
-      if not started and self.readyStates[index] != 2:
-        started = True
-        continue
-      # elif self.videoBufferSize[index] != 0:
-      elif self.readyStates[index] != 2:
-        if current_stall is not None:
-          # Close current stall
-          current_stall["end"] = self.get_timestamp_by_index(index)
-          self.stalls.append(current_stall)
-          current_stall = None
-      elif self.readyStates[index] == 2:
-        if current_stall is None:
-          current_stall = {"start": self.get_timestamp_by_index(index),
-                           "end": 0}
-    if current_stall is not None:
-      current_stall["end"] = self.endTime
-      self.stalls.append(current_stall)
+    Goes through the ready states and returns empty instances, the runs of state 2
+    :return:
+    """
+    runs = as_runs(self.readyStates)
+    starts, stops = stall_runs(runs, runs.values == 2)
+    # the last run ends with the session
+    times = np.append(np.asarray(self.timeStamps, dtype=np.float64), self.endTime)
+    self.stalls = RecordList(periods(times[starts], times[stops]))
 
   def gen_join_time(self):
     '''
 
     :return:
     '''
-    for index in range(len(self.rendState)):
-      if self.rendState[index] == "Playing":
-        self.joinTime = self.timeStamps[index] - (self.position[index] - self.position[index-1])
+    self.joinTime = 0
+    playing = self.get_rendering_state_code("Playing")
+    runs = as_runs(self.rendState)
+    for index, stop, value in runs.runs():
+      if value == playing:
+        self.joinTime = float(self.timeStamps[index] - (self.position[index] - self.position[index-1]))
         break
 
+  def get_time_at_resolution(self):
+    '''
+    :return: dict of (width, height) -> time spent at that resolution, from the runs of the resolution
+    '''
+    runs = as_runs(self.resolution)
+    times = {}
+    for value, duration in zip(runs.values.tolist(), runs.run_durations(self.timeStamps).tolist()):
+      key = tuple(value)
+      times[key] = times.get(key, 0) + duration
+    return times
 
   def get_bitrate_changes(self):
     """
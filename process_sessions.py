@@ -10,117 +10,173 @@ from time import mktime
 import numpy as np
 from netflix_session import NetflixSession
 from youtube_session import YoutubeSession
+from session_cache import SessionCache
+from session_pool import SessionPool, read_ahead
+from session_index import SessionIndex
+from session_reader import HeaderFilter
+from quantile_sketch import MetricSummary, load_summaries, save_summaries, merge_summaries
 from plot_session import plot_netflix_session,plot_youtube_session
 
 
+# What netflix_session_metrics reads from a session, the other columns are not decoded
+NETFLIX_METRICS_FIELDS = ("position", "stalls", "playingBitrate")
+
+
 def mean(numbers):
   return float(sum(numbers)) / max(len(numbers), 1)
 
-def parse_n_extension_squantiles(extfolder, recursive=True):
+def list_session_files(extfolder, sessiontype, recursive=True, index=None, header_filter=None):
   """
-  Parses files in a folder and extracts throughput values over time for a the entire system or for a specific device
-  :param folder: the folder to parse
-  :param device: the device to parse throughput for. If none, it parses the throughput for the entire system
-  :param day: specifies the date for which to get throughput values. If none, parses all files in a folder
-  :return: an ordered list of timestamps and througput values
+  Lists the session files of the monitored devices, selected from their names, then from their headers
+  :param extfolder: the folder to parse
+  :param sessiontype: 'n' for netflix, 'y' for youtube
+  :param recursive: walk the whole tree rather than the date folders only
+  :param index: a SessionIndex of extfolder, built if None
+  :param header_filter: a HeaderFilter the headers of the files must match, None to keep all the files
+  :return: list of file paths
+  """
+  if index is None:
+    index = SessionIndex(extfolder, recursive=recursive)
+  files = [f.path for f in index.select(sessiontype=sessiontype, ip="1935224")]
+  if header_filter is not None:
+    files = header_filter.select(files)
+  return files
+
+def netflix_session_metrics(filename, cache=None):
+  """
+  :return: dict of the startup time (the time at which the position first moves, None if it never does),
+  the durations of the stalls and the average playing bitrate of a netflix session, None if it has no
+  timestamps
+  """
+  try:
+    nf = NetflixSession(filename=filename, cache=cache, fields=NETFLIX_METRICS_FIELDS)
+  except KeyError:
+    return None
+  startup = None
+  positions = nf.get_positions()
+  for i in range(len(positions)):
+    if positions[i] > 0:
+      startup = nf.get_timestamp_by_index(i)
+      break
+  # stalls still open at the end of the session have no known duration
+  stalls = [s["end"] - s["start"] for s in nf.get_empty_buffers() if s["end"] != nf.endTime]
+  bitrates = [b for b in nf.get_playing_bitrates() if b > 0]
+  bitrate = float(sum(bitrates)) / len(bitrates) if bitrates else None
+  return {"startup": startup, "stalls": stalls, "bitrate": bitrate}
+
+def load_netflix_session(filename, cache=None):
+  try:
+    return NetflixSession(filename=filename, cache=cache)
+  except KeyError:
+    return None
+
+def load_youtube_session(filename, cache=None):
+  return YoutubeSession(filename=filename, cache=cache)
+
+def parse_n_extension_squantiles(extfolder, recursive=True, cache=None, pool=None, index=None, summaries=None,
+                                 header_filter=None):
+  """
+  Parses the netflix files of a folder and summarizes the startup time, stall duration and bitrate
+  of the sessions in constant memory
+  :param extfolder: the folder to parse
+  :param recursive: walk the whole tree rather than the date folders only
+  :param cache: a SessionCache holding previously parsed sessions
+  :param pool: the SessionPool parsing the files, by default one at a time in this process
+  :param index: a SessionIndex of extfolder, built if None
+  :param summaries: dict of metric name -> MetricSummary to add the sessions to, e.g. loaded from other runs
+  :param header_filter: a HeaderFilter selecting the sessions, None for all
+  :return: the dict of metric name -> MetricSummary
   """
-  sessions = []
-  dirs = os.listdir(extfolder)
-  # print "Parsing folder ", extfolder
-  for dir in dirs:
-    if os.path.isdir(extfolder+dir):
-      # print "Parsing folder ", dir
-      fs = os.listdir(extfolder+dir)
-      for f in fs:
-        # print "Parsing file ", f
-        if f.endswith("json"):
-          fn = f.split('/')[-1]
-          sessiontype = fn.split('_')[2]
-          ip = fn.split('_')[1]
-          if sessiontype == 'n' and "1935224" in ip:
-            try:
-              nf = NetflixSession(filename=extfolder+dir+"/"+f)
-              positions = nf.get_positions()
-              for i in range(len(positions)):
-                if positions[i] > 0:
-                  sessions.append(nf.get_timestamp_by_index(i))
-                  break
-            except KeyError:
-              continue
-            except Exception as e:
-              # print "Not possible to parse", extfolder+dir+"/"+f,"because", st, et, timearrs, trafarrs, e
-              print "Not possible to parse netflix", extfolder + dir + "/" + f, "because", e
-              # sys.exit(0)
-    else:
-      print "Not a dir ", extfolder+dir
+  if pool is None:
+    pool = SessionPool()
+  if summaries is None:
+    summaries = {}
+  for name in ["startup", "stalls", "bitrate"]:
+    summaries.setdefault(name, MetricSummary())
+  files = list_session_files(extfolder, 'n', recursive, index, header_filter)
+  for f, metrics in pool.map(netflix_session_metrics, files, args=(cache,)):
+    if metrics is None:
+      continue
+    if metrics["startup"] is not None:
+      summaries["startup"].update(metrics["startup"])
+    summaries["stalls"].update_many(metrics["stalls"])
+    if metrics["bitrate"] is not None:
+      summaries["bitrate"].update(metrics["bitrate"])
+  pool.print_summary("netflix")
   #compute quantiles
-  a = np.array(sessions)
-  print "AVG:", mean(sessions)
-  print "FINAL RESULT:", np.percentile(a, 25), np.percentile(a, 50), np.percentile(a, 75), np.percentile(a, 100)
-
-def parse_n_extension_traffic(extfolder, recursive=True):
+  startup = summaries["startup"]
+  print "AVG:", startup.stats.mean
+  print "FINAL RESULT:", " ".join(str(v) for v in startup.quantiles([.25, .5, .75, 1]))
+  for name in ["stalls", "bitrate"]:
+    summary = summaries[name]
+    print name.upper(), "N:", summary.stats.n, "AVG:", summary.stats.mean, "STD:", summary.stats.std(), \
+      "QUANTILES:", " ".join(str(v) for v in summary.quantiles([.25, .5, .75, 1]))
+  return summaries
+
+def iter_netflix_sessions(extfolder, recursive=True, cache=None, pool=None, index=None, prefetch=0,
+                          header_filter=None):
+  """
+  Parses the netflix files of a folder one at a time, so that only the sessions being
+  parsed and used are held in memory
+  :param extfolder: the folder to parse
+  :param recursive: walk the whole tree rather than the date folders only
+  :param cache: a SessionCache holding previously parsed sessions
+  :param pool: the SessionPool parsing the files, by default one at a time in this process
+  :param index: a SessionIndex of extfolder, built if None
+  :param prefetch: number of files parsed ahead of the caller, on a background thread or by the pool workers
+  :param header_filter: a HeaderFilter selecting the sessions, None for all
+  :return: generator of NetflixSession
+  """
+  if pool is None:
+    pool = SessionPool()
+  files = list_session_files(extfolder, 'n', recursive, index, header_filter)
+  for f, nf in _iter_parsed(pool, load_netflix_session, files, cache, prefetch):
+    if nf is not None:
+      yield nf
+  pool.print_summary("netflix")
+
+def iter_youtube_sessions(extfolder, recursive=True, cache=None, pool=None, index=None, prefetch=0,
+                          header_filter=None):
+  """
+  Parses the youtube files of a folder one at a time, see iter_netflix_sessions
+  :return: generator of YoutubeSession
+  """
+  if pool is None:
+    pool = SessionPool()
+  files = list_session_files(extfolder, 'y', recursive, index, header_filter)
+  for f, yt in _iter_parsed(pool, load_youtube_session, files, cache, prefetch):
+    yield yt
+  pool.print_summary("youtube")
+
+def _iter_parsed(pool, function, files, cache, prefetch):
+  if pool.jobs > 1:
+    return pool.map(function, files, args=(cache,), lookahead=max(prefetch, pool.jobs))
+  return read_ahead(pool.map(function, files, args=(cache,)), prefetch)
+
+def parse_n_extension_traffic(extfolder, recursive=True, cache=None, pool=None, index=None):
   """
   Parses files in a folder and extracts throughput values over time for a the entire system or for a specific device
   :param folder: the folder to parse
   :param device: the device to parse throughput for. If none, it parses the throughput for the entire system
   :param day: specifies the date for which to get throughput values. If none, parses all files in a folder
+  :param cache: a SessionCache holding previously parsed sessions
+  :param pool: the SessionPool parsing the files, by default one at a time in this process
+  :param index: a SessionIndex of extfolder, built if None
   :return: an ordered list of timestamps and througput values
   """
-  sessions = []
-  dirs = os.listdir(extfolder)
-  # print "Parsing folder ", extfolder
-  for dir in dirs:
-    if os.path.isdir(extfolder+dir):
-      # print "Parsing folder ", dir
-      fs = os.listdir(extfolder+dir)
-      for f in fs:
-        # print "Parsing file ", f
-        if f.endswith("json"):
-          fn = f.split('/')[-1]
-          sessiontype = fn.split('_')[2]
-          ip = fn.split('_')[1]
-          if sessiontype == 'n' and "1935224" in ip:
-            try:
-              nf = NetflixSession(filename=extfolder+dir+"/"+f)
-              # print extfolder + dir + "/" + f, " processed succesfully"
-              sessions.append(nf)
-            except KeyError:
-              continue
-            except Exception as e:
-              # print "Not possible to parse", extfolder+dir+"/"+f,"because", st, et, timearrs, trafarrs, e
-              print "Not possible to parse netflix", extfolder + dir + "/" + f, "because", e
-              # sys.exit(0)
-    else:
-      print "Not a dir ", extfolder+dir
-  return sessions
-
-
-def parse_y_extension_traffic(extfolder, recursive=True):
-  """
+  return list(iter_netflix_sessions(extfolder, recursive, cache, pool, index))
 
+
+def parse_y_extension_traffic(extfolder, recursive=True, cache=None, pool=None, index=None):
+  """
+  Parses the youtube files in a folder
+  :param extfolder: the folder to parse
+  :param cache: a SessionCache holding previously parsed sessions
+  :param pool: the SessionPool parsing the files, by default one at a time in this process
+  :param index: a SessionIndex of extfolder, built if None
+  :return: list of YoutubeSession
   """
-  dirs = os.listdir(extfolder)
-  # print "Parsing folder ", extfolder
-  for dir in dirs:
-    if os.path.isdir(extfolder+dir):
-      # print "Parsing folder ", dir
-      fs = os.listdir(extfolder+dir)
-      for f in fs:
-        # print "Parsing file ", f
-        if f.endswith("json"):
-          fn = f.split('/')[-1]
-          sessiontype = fn.split('_')[2]
-          ip = fn.split('_')[1]
-          if sessiontype == 'y' and "1935224" in ip:
-            try:
-              with open(extfolder+dir+"/"+f, 'r') as jsonstr:
-                yt = YoutubeSession(filename=jsonstr)
-                jsonstr.close()
-            except Exception as e:
-              # print "Not possible to parse", extfolder+dir+"/"+f,"because", st, et, timearrs, trafarrs, e
-              print "Not possible to parse youtube", extfolder + dir + "/" + f, "because", e
-    else:
-      print "Not a dir ", extfolder+dir
+  return list(iter_youtube_sessions(extfolder, recursive, cache, pool, index))
 
 
 def main():
@@ -129,28 +185,69 @@ def main():
   parser.add_argument('-n', '--netflix', action='store_true', help="parse netflix")
   parser.add_argument('-y', '--youtube', action='store_true', help="parse youtube")
   parser.add_argument('-p', '--plot', action='store_true', help="plot processed")
-  parser.add_argument('-r', '--recursive', action='store_true', help="recursive in folders")
+  parser.add_argument('-s', '--stats', action='store_true',
+                      help="summarize the netflix sessions, the default when neither -n nor -y is given")
+  parser.add_argument('-r', '--recursive', action='store_true',
+                      help="walk the whole tree, otherwise only the files of the date folders")
+  parser.add_argument('-c', '--cache', type=str, default=None, help="folder of the parse cache")
+  parser.add_argument('--cache-size', type=int, default=2048, help="size limit of the parse cache in MB")
+  parser.add_argument('-j', '--jobs', type=int, default=1, help="number of processes parsing files")
+  parser.add_argument('--timeout', type=int, default=None, help="seconds allowed to parse a file")
+  parser.add_argument('--memory-limit', type=int, default=None, help="memory limit of each process in MB")
+  parser.add_argument('--unordered', action='store_true', help="collect sessions as they are parsed")
+  parser.add_argument('--prefetch', type=int, default=0, help="number of files parsed ahead")
+  parser.add_argument('--stats-in', type=str, action='append', default=[], help="merge statistics saved by another run")
+  parser.add_argument('--stats-out', type=str, default=None, help="save the statistics for later merging")
+  parser.add_argument('-i', '--index', type=str, default=None, help="file keeping the index of the folder between runs")
+  parser.add_argument('--mid', type=str, action='append', default=None, help="only the sessions of this movie id")
+  parser.add_argument('--after', type=int, default=None, help="only the sessions ending after this time, in ms")
+  parser.add_argument('--before', type=int, default=None, help="only the sessions starting before this time, in ms")
+  parser.add_argument('--user-agent', type=str, default=None, help="only the sessions whose user agent contains this")
+  parser.add_argument('--ext-version', type=str, action='append', default=None,
+                      help="only the sessions recorded by this extension version")
 
   args = vars(parser.parse_args())
 
-  parse_n_extension_squantiles(args['folder'])
-  return
-
-  nsessions = []
-  ysessions = []
+  cache = None
+  if args['cache'] is not None:
+    cache = SessionCache(args['cache'], max_size=args['cache_size'] << 20)
+
+  memory_limit = None
+  if args['memory_limit'] is not None:
+    memory_limit = args['memory_limit'] << 20
+  pool = SessionPool(jobs=args['jobs'], timeout=args['timeout'], memory_limit=memory_limit,
+                     ordered=not args['unordered'])
+
+  index = SessionIndex(args['folder'], recursive=args['recursive'], filename=args['index'])
+  if args['index'] is not None:
+    index.save()
+
+  header_filter = None
+  if any(args[name] is not None for name in ['mid', 'after', 'before', 'user_agent', 'ext_version']):
+    header_filter = HeaderFilter(mids=args['mid'], start=args['after'], end=args['before'],
+                                 useragent=args['user_agent'], versions=args['ext_version'])
+
+  if args['stats'] or not (args['netflix'] or args['youtube']):
+    summaries = {}
+    for filename in args['stats_in']:
+      merge_summaries(summaries, load_summaries(filename))
+    summaries = parse_n_extension_squantiles(args['folder'], cache=cache, pool=pool, index=index,
+                                             summaries=summaries, header_filter=header_filter)
+    if args['stats_out'] is not None:
+      save_summaries(summaries, args['stats_out'])
+
+  # sessions are plotted as they are parsed, so that only a few are in memory at once
   if args['netflix']:
-    nsessions = parse_n_extension_traffic(args['folder'], recursive=args['recursive'])
+    for session in iter_netflix_sessions(args['folder'], recursive=args['recursive'], cache=cache, pool=pool,
+                                         index=index, prefetch=args['prefetch'], header_filter=header_filter):
+      if args['plot']:
+        plot_netflix_session(session, "plots/")
 
   if args['youtube']:
-    ysessions = parse_y_extension_traffic(args['folder'], recursive=args['recursive'])
-
-  if args['plot']:
-    #create plots folder if needed
-    for session in nsessions:
-      plot_netflix_session(session, "plots/")
-
-    for session in ysessions:
-      plot_youtube_session(session, "plots/")
+    for session in iter_youtube_sessions(args['folder'], recursive=args['recursive'], cache=cache, pool=pool,
+                                         index=index, prefetch=args['prefetch'], header_filter=header_filter):
+      if args['plot']:
+        plot_youtube_session(session, "plots/")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,288 @@
+import math
+import json
+import random
+
+
+class QuantileSketchError(Exception):
+  pass
+
+
+class RunningStats:
+  """
+  Count, mean, variance, minimum and maximum of a stream of values in constant memory,
+  mergeable with the statistics of another stream
+  """
+
+  def __init__(self):
+    self.n = 0
+    self.mean = 0.0
+    self.m2 = 0.0
+    self.min = None
+    self.max = None
+
+  def update(self, x):
+    self.n += 1
+    delta = x - self.mean
+    self.mean += delta / self.n
+    self.m2 += delta * (x - self.mean)
+    if self.min is None or x < self.min:
+      self.min = x
+    if self.max is None or x > self.max:
+      self.max = x
+
+  def merge(self, other):
+    """
+    Adds the values summarized by other, combining the moments with Chan's formula
+    :return: nothing
+    """
+    if other.n == 0:
+      return
+    if self.n == 0:
+      self.n, self.mean, self.m2, self.min, self.max = other.n, other.mean, other.m2, other.min, other.max
+      return
+    n = self.n + other.n
+    delta = other.mean - self.mean
+    self.mean += delta * other.n / n
+    self.m2 += other.m2 + delta * delta * self.n * other.n / n
+    self.n = n
+    self.min = min(self.min, other.min)
+    self.max = max(self.max, other.max)
+
+  def variance(self):
+    """
+    :return: the sample variance, 0 for less than two values
+    """
+    if self.n < 2:
+      return 0.0
+    return self.m2 / (self.n - 1)
+
+  def std(self):
+    return math.sqrt(self.variance())
+
+  def to_dict(self):
+    return {"n": self.n, "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max}
+
+  @staticmethod
+  def from_dict(d):
+    stats = RunningStats()
+    stats.n, stats.mean, stats.m2, stats.min, stats.max = d["n"], d["mean"], d["m2"], d["min"], d["max"]
+    return stats
+
+
+class KLLSketch:
+  """
+  KLL quantile sketch (Karnin, Lang and Liberty). Values are kept in a hierarchy of
+  compactors where an item of level h stands for 2^h values; a full level is sorted
+  and every other item is promoted to the next one. Memory is O(k) whatever the number
+  of values, the rank error is about 1.7/k, and sketches of separate streams merge into
+  a sketch of their union.
+  """
+
+  def __init__(self, k=200, seed=None):
+    """
+    :param k: accuracy parameter, the capacity of the top level
+    :param seed: seed of the coin choosing which items are promoted
+    :return:
+    """
+    if k < 2:
+      raise QuantileSketchError("k must be at least 2, got " + str(k))
+    self.k = k
+    self.n = 0
+    self.compactors = [[]]
+    self.size = 0
+    self.max_size = 0
+    self.random = random.Random(seed)
+    self._update_max_size()
+
+  def _capacity(self, level):
+    depth = len(self.compactors) - level - 1
+    return int(math.ceil(self.k * (2.0 / 3) ** depth)) + 1
+
+  def _update_max_size(self):
+    self.max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+
+  def update(self, x):
+    self.compactors[0].append(x)
+    self.n += 1
+    self.size += 1
+    if self.size >= self.max_size:
+      self._compress()
+
+  def update_many(self, values):
+    for x in values:
+      self.update(x)
+
+  def _compress(self):
+    while self.size >= self.max_size:
+      for h in range(len(self.compactors)):
+        if len(self.compactors[h]) >= self._capacity(h):
+          if h + 1 == len(self.compactors):
+            self.compactors.append([])
+            self._update_max_size()
+          items = sorted(self.compactors[h])
+          # an odd item out stays at this level
+          kept = [items.pop()] if len(items) % 2 else []
+          promoted = items[self.random.randint(0, 1)::2]
+          self.compactors[h + 1].extend(promoted)
+          self.compactors[h] = kept
+          self.size += len(promoted) - len(items)
+          break
+      else:
+        break
+
+  def merge(self, other):
+    """
+    Adds the values summarized by other, which must have the same k
+    :return: nothing
+    """
+    if other.k != self.k:
+      raise QuantileSketchError("Cannot merge sketches with k %d and %d" % (self.k, other.k))
+    while len(self.compactors) < len(other.compactors):
+      self.compactors.append([])
+    self._update_max_size()
+    for h, items in enumerate(other.compactors):
+      self.compactors[h].extend(items)
+    self.n += other.n
+    self.size = sum(len(c) for c in self.compactors)
+    self._compress()
+
+  def _ranked(self):
+    """
+    :return: sorted list of (value, cumulative weight)
+    """
+    weighted = sorted((x, 1 << h) for h, items in enumerate(self.compactors) for x in items)
+    ranked = []
+    total = 0
+    for x, w in weighted:
+      total += w
+      ranked.append((x, total))
+    return ranked
+
+  def quantiles(self, qs):
+    """
+    :param qs: list of quantiles between 0 and 1
+    :return: list of the estimated values at these quantiles, None if the sketch is empty
+    """
+    if self.n == 0:
+      return [None for q in qs]
+    ranked = self._ranked()
+    total = ranked[-1][1]
+    values = []
+    for q in qs:
+      target = q * total
+      value = ranked[-1][0]
+      for x, cumulative in ranked:
+        if cumulative >= target:
+          value = x
+          break
+      values.append(value)
+    return values
+
+  def quantile(self, q):
+    return self.quantiles([q])[0]
+
+  def rank(self, x):
+    """
+    :return: the estimated fraction of the values lower than or equal to x
+    """
+    if self.n == 0:
+      return 0.0
+    ranked = self._ranked()
+    below = 0
+    for value, cumulative in ranked:
+      if value > x:
+        break
+      below = cumulative
+    return float(below) / ranked[-1][1]
+
+  def to_dict(self):
+    return {"k": self.k, "n": self.n, "compactors": self.compactors}
+
+  @staticmethod
+  def from_dict(d):
+    sketch = KLLSketch(d["k"])
+    sketch.n = d["n"]
+    sketch.compactors = [list(items) for items in d["compactors"]]
+    sketch.size = sum(len(c) for c in sketch.compactors)
+    sketch._update_max_size()
+    return sketch
+
+
+class MetricSummary:
+  """
+  Running statistics and quantile sketch of one metric, e.g. the startup time of sessions
+  """
+
+  def __init__(self, k=200):
+    self.stats = RunningStats()
+    self.sketch = KLLSketch(k)
+
+  def update(self, x):
+    self.stats.update(x)
+    self.sketch.update(x)
+
+  def update_many(self, values):
+    for x in values:
+      self.update(x)
+
+  def merge(self, other):
+    self.stats.merge(other.stats)
+    self.sketch.merge(other.sketch)
+
+  def quantiles(self, qs):
+    """
+    :param qs: list of quantiles between 0 and 1
+    :return: list of the estimated values, exact for the quantiles 0 and 1
+    """
+    values = self.sketch.quantiles(qs)
+    for i, q in enumerate(qs):
+      if q <= 0:
+        values[i] = self.stats.min
+      elif q >= 1:
+        values[i] = self.stats.max
+    return values
+
+  def to_dict(self):
+    return {"stats": self.stats.to_dict(), "sketch": self.sketch.to_dict()}
+
+  @staticmethod
+  def from_dict(d):
+    summary = MetricSummary(d["sketch"]["k"])
+    summary.stats = RunningStats.from_dict(d["stats"])
+    summary.sketch = KLLSketch.from_dict(d["sketch"])
+    return summary
+
+
+def save_summaries(summaries, filename):
+  """
+  :param summaries: dict of metric name -> MetricSummary
+  :param filename: the JSON file to write
+  :return: nothing
+  """
+  with open(filename, 'w') as f:
+    json.dump(dict((name, summary.to_dict()) for name, summary in summaries.items()), f)
+
+
+def load_summaries(filename):
+  """
+  :return: dict of metric name -> MetricSummary read from a file written by save_summaries
+  """
+  try:
+    with open(filename, 'r') as f:
+      saved = json.load(f)
+  except (IOError, ValueError) as e:
+    raise QuantileSketchError("Cannot read summaries " + filename + ": " + str(e))
+  return dict((name, MetricSummary.from_dict(d)) for name, d in saved.items())
+
+
+def merge_summaries(summaries, others):
+  """
+  Merges others into summaries, adding the metrics summaries does not have
+  :return: summaries
+  """
+  for name, summary in others.items():
+    if name in summaries:
+      summaries[name].merge(summary)
+    else:
+      summaries[name] = summary
+  return summaries
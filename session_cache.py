@@ -0,0 +1,179 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+# Bump whenever a change to the parsers alters the content of the parsed sessions,
+# entries written by other versions are then ignored and eventually evicted
+PARSER_VERSION = 8
+
+DEFAULT_FOLDER = os.path.join(os.path.expanduser("~"), ".cache", "videoanalysis")
+DEFAULT_MAX_SIZE = 2 << 30
+STATE_KEY = "__state__"
+SUFFIX = ".npz"
+
+
+class SessionCacheError(Exception):
+  pass
+
+
+def _to_python(value):
+  """
+  JSON encoder fallback for NumPy scalars and arrays
+  """
+  if isinstance(value, np.generic):
+    return value.item()
+  if isinstance(value, np.ndarray):
+    return value.tolist()
+  raise TypeError("%r is not JSON serializable" % (value,))
+
+
+class SessionCache:
+  """
+  On-disk cache of parsed sessions. Every entry is a NumPy .npz file holding the
+  columns of a session plus its scalar fields and derived results as JSON. Entries
+  are keyed by the source file path, size and modification time (or its content),
+  the session class, the storage mode and PARSER_VERSION, so any change to one of
+  them is a miss. The least recently used entries are evicted once the cache grows
+  beyond max_size bytes.
+  """
+
+  def __init__(self, folder=DEFAULT_FOLDER, max_size=DEFAULT_MAX_SIZE, hash_content=False):
+    """
+    :param folder: where the entries are stored, created if needed
+    :param max_size: size in bytes above which entries are evicted
+    :param hash_content: key entries by a hash of the file content instead of its modification time
+    :return:
+    """
+    self.folder = folder
+    self.max_size = max_size
+    self.hash_content = hash_content
+    self.size = None
+    self.hits = 0
+    self.misses = 0
+    if not os.path.isdir(folder):
+      os.makedirs(folder)
+
+  def source_stamp(self, filename):
+    """
+    :return: a dict identifying the current version of filename
+    """
+    st = os.stat(filename)
+    stamp = {"path": os.path.abspath(filename), "size": st.st_size, "parser": PARSER_VERSION}
+    if self.hash_content:
+      digest = hashlib.sha1()
+      with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+          digest.update(chunk)
+      stamp["sha1"] = digest.hexdigest()
+    else:
+      stamp["mtime"] = st.st_mtime
+    return stamp
+
+  def entry_path(self, stamp, kind):
+    """
+    :param stamp: the source stamp of the file
+    :param kind: identifies the session class and storage mode
+    :return: the path of the cache entry
+    """
+    key = json.dumps([kind, stamp], sort_keys=True)
+    return os.path.join(self.folder, hashlib.sha1(key.encode("utf-8")).hexdigest() + SUFFIX)
+
+  def load(self, filename, kind):
+    """
+    :param filename: the session file
+    :param kind: identifies the session class and storage mode
+    :return: a tuple (dict of name -> array, dict of fields), None on a miss
+    """
+    stamp = self.source_stamp(filename)
+    path = self.entry_path(stamp, kind)
+    try:
+      with open(path, 'rb') as f:
+        npz = np.load(f, allow_pickle=False)
+        arrays = dict((name, npz[name]) for name in npz.files)
+    except (IOError, OSError, ValueError):
+      self.misses += 1
+      return None
+    state = json.loads(arrays.pop(STATE_KEY).tobytes().decode("utf-8"))
+    if state.get("stamp") != json.loads(json.dumps(stamp)) or state.get("kind") != kind:
+      self.remove(path)
+      self.misses += 1
+      return None
+    try:
+      os.utime(path, None)
+    except OSError:
+      pass
+    self.hits += 1
+    return arrays, state["fields"]
+
+  def store(self, filename, kind, arrays, fields):
+    """
+    Writes the entry of a parsed session, then evicts old entries if needed
+    :param filename: the session file
+    :param kind: identifies the session class and storage mode
+    :param arrays: dict of name -> array
+    :param fields: dict of JSON serializable values
+    :return: nothing
+    """
+    stamp = self.source_stamp(filename)
+    path = self.entry_path(stamp, kind)
+    state = json.dumps({"stamp": stamp, "kind": kind, "fields": fields}, default=_to_python)
+    arrays = dict(arrays)
+    arrays[STATE_KEY] = np.frombuffer(state.encode("utf-8"), dtype=np.uint8)
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.folder)
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **arrays)
+      os.rename(tmp, path)
+    except Exception as e:
+      self.remove(tmp)
+      raise SessionCacheError("Cannot write cache entry for " + filename + ": " + str(e))
+    if self.size is not None:
+      self.size += os.path.getsize(path)
+    self.evict()
+
+  def remove(self, path):
+    try:
+      size = os.path.getsize(path)
+      os.remove(path)
+      if self.size is not None:
+        self.size -= size
+    except OSError:
+      pass
+
+  def entries(self):
+    """
+    :return: list of (last use, size, path) of the cache entries
+    """
+    entries = []
+    for name in os.listdir(self.folder):
+      if name.endswith(SUFFIX):
+        path = os.path.join(self.folder, name)
+        try:
+          st = os.stat(path)
+        except OSError:
+          continue
+        entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+  def evict(self):
+    """
+    Removes the least recently used entries until the cache is 10% below max_size
+    :return: nothing
+    """
+    if self.size is None:
+      self.size = sum(size for _, size, _ in self.entries())
+    if self.size <= self.max_size:
+      return
+    entries = sorted(self.entries())
+    self.size = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+      if self.size <= 0.9 * self.max_size:
+        break
+      self.remove(path)
+
+  def clear(self):
+    for _, _, path in self.entries():
+      self.remove(path)
+    self.size = 0
@@ -0,0 +1,755 @@
+import re
+import bisect
+import numpy as np
+
+# One range of the strings written by the extension, e.g. "[{s:0,e:10.5},{s:20,e:30}]"
+RANGE = re.compile(r'\{s:([^,{}]*),e:([^,{}]*)\}')
+# What may remain of a well formed ranges string once its ranges are removed
+RANGE_SEPARATORS = re.compile(r'[\[\],\s]*$')
+
+# Values of the direction field of bitrate changes
+UP = 1
+DOWN = -1
+DIRECTIONS = {UP: "up", DOWN: "down"}
+# Stalls, as periods [start, end] on the time scale of the samples
+STALL_DTYPE = np.dtype([("start", np.float64), ("end", np.float64)])
+
+
+class Column:
+  """
+  Description of a per-sample column of a session
+  """
+
+  def __init__(self, name, dtype, default=0, width=None, categorical=False):
+    """
+    :param name: attribute of the session the column is stored in
+    :param dtype: NumPy dtype used in columnar mode
+    :param default: value of the samples before the first valid one
+    :param width: number of values per sample for 2-D columns (e.g. resolution)
+    :param categorical: the values are short strings stored as integer codes
+    :return:
+    """
+    self.name = name
+    self.dtype = np.dtype(np.int8 if categorical else dtype)
+    self.default = default
+    self.width = width
+    self.categorical = categorical
+
+  def storage_dtype(self, compact):
+    """
+    :param compact: use the columnar dtype, otherwise widen numbers to 64 bits so that
+    values converted back to lists are the same as the ones parsed
+    :return: the dtype to decode the column into
+    """
+    if compact or self.categorical:
+      return self.dtype
+    if self.dtype.kind == 'f':
+      return np.dtype(np.float64)
+    if self.dtype.kind in 'iu':
+      return np.dtype(np.int64)
+    return self.dtype
+
+  def alloc(self, size, compact):
+    """
+    :return: a zeroed array for size samples
+    """
+    shape = size if self.width is None else (size, self.width)
+    return np.zeros(shape, dtype=self.storage_dtype(compact))
+
+
+def forward_fill(data, present, default):
+  """
+  Replaces every sample that is not present by the last present one
+  :param data: the column values
+  :param present: boolean mask of the samples holding a value
+  :param default: value of the samples before the first present one
+  :return: the filled column (data itself if nothing is missing)
+  """
+  size = len(data)
+  if present.all():
+    return data
+  idx = np.where(present, np.arange(size), 0)
+  np.maximum.accumulate(idx, out=idx)
+  filled = data[idx]
+  first = int(np.argmax(present)) if present.any() else size
+  if data.dtype == object:
+    for i in range(first):
+      filled[i] = default
+  else:
+    filled[:first] = default
+  return filled
+
+
+# How a time between two samples is resolved
+PREVIOUS = "previous"
+NEXT = "next"
+NEAREST = "nearest"
+INTERPOLATE = "interpolate"
+
+
+def time_index(timestamps, t, mode=PREVIOUS, slack=0):
+  """
+  Finds the sample at time t by binary search
+  :param timestamps: sorted sample times, a list or an array
+  :param t: the time, on the scale of timestamps
+  :param mode: PREVIOUS for the last sample at or before t, NEXT for the first one at or after t,
+  NEAREST for the closest one
+  :param slack: how far from a sample t is still covered by it, at both ends of the samples
+  :return: the index of the sample, None if there is none within slack of t
+  """
+  n = len(timestamps)
+  if n == 0:
+    return None
+  first = timestamps[0] if mode == PREVIOUS else timestamps[0] - slack
+  last = timestamps[-1] if mode == NEXT else timestamps[-1] + slack
+  if t < first or t > last:
+    return None
+  if isinstance(timestamps, np.ndarray):
+    i = int(np.searchsorted(timestamps, t, side='right')) - 1
+  else:
+    i = bisect.bisect_right(timestamps, t) - 1
+  if i < 0:
+    return 0
+  if mode == PREVIOUS or timestamps[i] == t or i == n - 1:
+    return i
+  if mode == NEXT:
+    return i + 1
+  if mode == NEAREST:
+    return i if t - timestamps[i] <= timestamps[i + 1] - t else i + 1
+  raise ValueError("Unknown lookup mode " + str(mode))
+
+
+def value_at(timestamps, values, t, mode=PREVIOUS, slack=0):
+  """
+  :param timestamps: sorted sample times, a list or an array
+  :param values: the column to look up, one value per sample
+  :param t: the time, on the scale of timestamps
+  :param mode: PREVIOUS, NEXT or NEAREST as in time_index, or INTERPOLATE linearly between the
+  samples around t. Values that are not scalar numbers, e.g. buffered ranges or resolutions, are
+  not interpolated and the previous one is returned
+  :param slack: how far from a sample t is still covered by it, at both ends of the samples
+  :return: the value, None if t is outside the samples
+  """
+  if mode != INTERPOLATE:
+    i = time_index(timestamps, t, mode, slack)
+    return None if i is None else values[i]
+  i = time_index(timestamps, t, PREVIOUS, slack)
+  if i is None:
+    return None
+  if i == len(timestamps) - 1 or timestamps[i] == t or np.ndim(values[i]) != 0:
+    return values[i]
+  try:
+    weight = float(t - timestamps[i]) / (timestamps[i + 1] - timestamps[i])
+    return values[i] + (values[i + 1] - values[i]) * weight
+  except TypeError:
+    return values[i]
+
+
+def sample_range(timestamps, low=None, high=None):
+  """
+  :param timestamps: sorted sample times, a list or an array
+  :param low: first time of the range, None for no lower bound
+  :param high: end of the range, excluded, None for no upper bound
+  :return: a tuple (start, stop) of the indices of the samples in [low, high)
+  """
+  if isinstance(timestamps, np.ndarray):
+    start = 0 if low is None else int(np.searchsorted(timestamps, low, side='left'))
+    stop = len(timestamps) if high is None else int(np.searchsorted(timestamps, high, side='left'))
+  else:
+    start = 0 if low is None else bisect.bisect_left(timestamps, low)
+    stop = len(timestamps) if high is None else bisect.bisect_left(timestamps, high)
+  return start, max(start, stop)
+
+
+def time_indices(timestamps, times, mode=PREVIOUS, slack=0):
+  """
+  Vectorized time_index, with a single searchsorted pass over all the times
+  :param timestamps: sorted sample times, a list or an array
+  :param times: the times to look up
+  :param mode: PREVIOUS, NEXT or NEAREST
+  :param slack: how far from a sample a time is still covered by it, at both ends of the samples
+  :return: array of the indices of the samples, -1 where there is none within slack
+  """
+  ts = np.asarray(timestamps, dtype=np.float64)
+  times = np.asarray(times, dtype=np.float64)
+  n = len(ts)
+  if n == 0:
+    return np.full(len(times), -1, dtype=np.int64)
+  first = ts[0] if mode == PREVIOUS else ts[0] - slack
+  last = ts[-1] if mode == NEXT else ts[-1] + slack
+  valid = (times >= first) & (times <= last)
+  i = np.searchsorted(ts, times, side='right') - 1
+  below = i < 0
+  i = np.maximum(i, 0)
+  j = np.minimum(i + 1, n - 1)
+  if mode == PREVIOUS:
+    indices = i
+  elif mode == NEXT:
+    indices = np.where(below | (ts[i] == times), i, j)
+  elif mode == NEAREST:
+    indices = np.where(below | (times - ts[i] <= ts[j] - times), i, j)
+  else:
+    raise ValueError("Unknown lookup mode " + str(mode))
+  return np.where(valid, indices, -1)
+
+
+def values_at(timestamps, columns, times, mode=PREVIOUS, slack=0):
+  """
+  Vectorized value_at, looking up several columns at all the times at once
+  :param timestamps: sorted sample times, a list or an array
+  :param columns: list of columns, one value per sample each
+  :param times: the times to look up
+  :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
+  :param slack: how far from a sample a time is still covered by it, at both ends of the samples
+  :return: list holding for every column the list of its values at times, None where there is no sample
+  """
+  interpolate = mode == INTERPOLATE
+  indices = time_indices(timestamps, times, PREVIOUS if interpolate else mode, slack)
+  valid = (indices >= 0).tolist()
+  indices = np.maximum(indices, 0)
+  if interpolate and len(timestamps) > 0:
+    ts = np.asarray(timestamps, dtype=np.float64)
+    following = np.minimum(indices + 1, len(ts) - 1)
+    span = ts[following] - ts[indices]
+    weights = np.where(span > 0, (np.asarray(times, dtype=np.float64) - ts[indices]) / np.where(span > 0, span, 1), 0)
+  results = []
+  for values in columns:
+    numbers = None
+    if interpolate and isinstance(values, (list, np.ndarray)):
+      try:
+        numbers = np.asarray(values)
+      except ValueError:
+        pass
+      if numbers is not None and (numbers.ndim != 1 or numbers.dtype.kind not in 'iuf'):
+        numbers = None
+    if numbers is not None:
+      picked = numbers[indices]
+      picked = (picked + (numbers[following] - picked) * weights).tolist()
+    elif isinstance(values, np.ndarray):
+      picked = values[indices].tolist()
+    else:
+      picked = [values[i] for i in indices.tolist()]
+    results.append([v if ok else None for v, ok in zip(picked, valid)])
+  return results
+
+
+class RangeTable:
+  """
+  Column of per-sample sets of (start, end) ranges, e.g. the buffered ranges of a video,
+  in CSR layout: the ranges of all the distinct sets are stored in the flat arrays starts
+  and ends, set k spanning offsets[k]:offsets[k+1], and index maps every sample to its set.
+  Consecutive samples with the same ranges share one set. The table behaves as a read-only
+  list of lists of (start, end) tuples.
+  """
+
+  def __init__(self, index, offsets, starts, ends):
+    """
+    :param index: array of the set of every sample
+    :param offsets: array of the bounds of the sets in starts and ends, one more than the sets
+    :param starts: array of the range starts
+    :param ends: array of the range ends
+    :return:
+    """
+    self.index = index
+    self.offsets = offsets
+    self.starts = starts
+    self.ends = ends
+
+  @staticmethod
+  def from_lists(buffers):
+    """
+    :param buffers: sequence of lists of (start, end) tuples, one per sample
+    :return: a RangeTable of the same ranges
+    """
+    index = []
+    offsets = [0]
+    starts = []
+    ends = []
+    previous = None
+    for ranges in buffers:
+      if not index or (ranges is not previous and ranges != previous):
+        for start, end in ranges:
+          starts.append(start)
+          ends.append(end)
+        offsets.append(len(starts))
+        previous = ranges
+      index.append(len(offsets) - 2)
+    return RangeTable(np.array(index, dtype=np.int32), np.array(offsets, dtype=np.int64),
+                      np.array(starts, dtype=np.float64), np.array(ends, dtype=np.float64))
+
+  @staticmethod
+  def from_strings(values, default=(), fill_previous=True):
+    """
+    Parses the ranges strings of the extension, e.g. "[{s:0,e:10.5},{s:20,e:30}]", whatever
+    the version that wrote them. Every distinct string is parsed once, and all of them are
+    scanned by a single regular expression pass over their concatenation.
+    :param values: sequence of strings, None for the samples without ranges
+    :param default: ranges of the samples before the first valid string, or of all the samples
+    without a valid string if fill_previous is False
+    :param fill_previous: samples without a valid string take the ranges of the previous sample
+    :return: a tuple (RangeTable, list of the indices of the samples whose string is malformed)
+    """
+    codes = {}
+    sampleCodes = np.array([-1 if value is None else codes.setdefault(value, len(codes)) for value in values],
+                           dtype=np.int64)
+    strings = [None] * len(codes)
+    for value, code in codes.items():
+      strings[code] = value
+    valid = np.ones(len(strings) + 1, dtype=bool)
+    for code, value in enumerate(strings):
+      if "\n" in value:
+        valid[code] = False
+        strings[code] = ""
+    text = "\n".join(strings)
+    lineStarts = np.cumsum([0] + [len(value) + 1 for value in strings])[:-1]
+    matches = [(m.start(), m.group(1), m.group(2)) for m in RANGE.finditer(text)]
+    residue = RANGE.sub("", text).split("\n") if strings else []
+    valid[:len(strings)] &= np.array([RANGE_SEPARATORS.match(r) is not None for r in residue], dtype=bool)
+    owners = np.searchsorted(lineStarts, [m[0] for m in matches], side='right').astype(np.int64) - 1
+    try:
+      starts = np.array([m[1] for m in matches], dtype=np.float64)
+      ends = np.array([m[2] for m in matches], dtype=np.float64)
+    except ValueError:
+      starts = np.zeros(len(matches))
+      ends = np.zeros(len(matches))
+      for i, (position, start, end) in enumerate(matches):
+        try:
+          starts[i] = float(start)
+          ends[i] = float(end)
+        except ValueError:
+          valid[owners[i]] = False
+    # the pairs of a string are contiguous, the default ranges are the last set
+    counts = np.bincount(owners, minlength=len(strings))
+    # a string without any range, e.g. "[]", is malformed like in the older versions
+    valid[:len(strings)] &= counts > 0
+    offsets = np.concatenate([[0], np.cumsum(counts), [len(matches) + len(default)]]).astype(np.int64)
+    starts = np.concatenate([starts, [r[0] for r in default]])
+    ends = np.concatenate([ends, [r[1] for r in default]])
+    defaultSet = len(strings)
+    # strings written differently but holding the same ranges share one set, so that the
+    # samples only differ where the ranges do
+    canonical = np.arange(len(strings) + 1)
+    seen = {}
+    for code in np.flatnonzero(valid):
+      a, b = offsets[code], offsets[code + 1]
+      canonical[code] = seen.setdefault((tuple(starts[a:b].tolist()), tuple(ends[a:b].tolist())), code)
+    sets = np.where(sampleCodes >= 0, sampleCodes, defaultSet)
+    present = valid[sets] & (sampleCodes >= 0)
+    sets = canonical[sets]
+    defaultSet = canonical[defaultSet]
+    if fill_previous:
+      index = forward_fill(sets, present, defaultSet)
+    else:
+      index = np.where(present, sets, defaultSet)
+    malformed = np.flatnonzero((sampleCodes >= 0) & ~valid[sets]).tolist()
+    return RangeTable(index.astype(np.int32), offsets, starts, ends), malformed
+
+  def __len__(self):
+    return len(self.index)
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return RangeTable(self.index[i], self.offsets, self.starts, self.ends)
+    k = self.index[i]
+    a, b = self.offsets[k], self.offsets[k + 1]
+    return zip(self.starts[a:b].tolist(), self.ends[a:b].tolist())
+
+  def __iter__(self):
+    for i in range(len(self.index)):
+      yield self[i]
+
+  def __eq__(self, other):
+    try:
+      return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+    except TypeError:
+      return False
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return "RangeTable(%d samples, %d sets, %d ranges)" % (len(self.index), len(self.offsets) - 1, len(self.starts))
+
+  def tolist(self):
+    return list(self)
+
+  def set_bounds(self, i):
+    """
+    :return: the bounds (a, b) of the ranges of sample i in starts and ends
+    """
+    k = self.index[i]
+    return self.offsets[k], self.offsets[k + 1]
+
+  def next_change(self, start):
+    """
+    :param start: the first sample to look at
+    :return: the first sample after start whose ranges differ from those of the previous sample, -1 if none
+    """
+    changes = np.flatnonzero(self.index[start + 1:] != self.index[start:-1])
+    return int(changes[0]) + start + 1 if len(changes) else -1
+
+  def nbytes(self):
+    return self.index.nbytes + self.offsets.nbytes + self.starts.nbytes + self.ends.nbytes
+
+  def first_lengths(self):
+    """
+    :return: array of the length of the first range of every sample, 0 for samples without ranges
+    """
+    a = self.offsets[self.index]
+    holding = self.offsets[self.index + 1] > a
+    lengths = np.zeros(len(self.index))
+    lengths[holding] = self.ends[a[holding]] - self.starts[a[holding]]
+    return lengths
+
+  def forward_lengths(self, positions):
+    """
+    Computes for every sample how far its ranges extend beyond a position, in one pass
+    over all the (sample, range) pairs
+    :param positions: one position per sample, e.g. the current time of the video
+    :return: a tuple (array of the distance from the position to the end of the first range
+    holding it, or to the end of the furthest range if none holds it, NaN for samples
+    without ranges; boolean array of the samples whose position is inside one of their ranges)
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    n = len(self.index)
+    counts = np.diff(self.offsets)
+    lengths = counts[self.index]
+    # every (sample, range) pair, grouped by sample
+    sample = np.repeat(np.arange(n), lengths)
+    firsts = np.cumsum(lengths) - lengths
+    pair = self.offsets[self.index][sample] + (np.arange(len(sample)) - firsts[sample])
+    position = positions[sample]
+    inside = (self.starts[pair] <= position) & (position <= self.ends[pair])
+    candidates = np.where(inside, np.arange(len(sample)), len(sample))
+    nonempty = lengths > 0
+    hit = np.full(n, len(sample), dtype=np.int64)
+    if len(sample):
+      hit[nonempty] = np.minimum.reduceat(candidates, firsts[nonempty])
+    holding = hit < len(sample)
+    furthest = np.full(n, np.nan)
+    sets = counts > 0
+    if sets.any():
+      setMax = np.full(len(counts), np.nan)
+      setMax[sets] = np.maximum.reduceat(self.ends, self.offsets[:-1][sets])
+      furthest = setMax[self.index]
+    ends = furthest
+    if len(sample):
+      ends = np.where(holding, self.ends[pair[np.minimum(hit, len(sample) - 1)]], furthest)
+    return ends - positions, holding
+
+
+class RunLengthColumn:
+  """
+  Column of a piecewise-constant series, e.g. the resolution of a video, stored as its runs:
+  starts holds the index of the first sample of every run and values the value of the run.
+  A sample is found by binary search on starts, and the runs can be read directly, e.g. to
+  find the changes of the series. The column behaves as a read-only sequence of the samples.
+  """
+
+  def __init__(self, starts, values, length):
+    """
+    :param starts: array of the first sample of every run, starting with 0
+    :param values: array of the value of every run, a row per run for 2-D columns
+    :param length: number of samples
+    :return:
+    """
+    self.starts = starts
+    self.values = values
+    self.length = length
+
+  @staticmethod
+  def encode(values):
+    """
+    :param values: sequence or array of the samples, a row per sample for 2-D columns
+    :return: a RunLengthColumn of the samples
+    """
+    values = np.asarray(values)
+    if len(values) == 0:
+      return RunLengthColumn(np.zeros(0, dtype=np.int64), values, 0)
+    changed = values[1:] != values[:-1]
+    if changed.ndim > 1:
+      changed = changed.any(axis=tuple(range(1, changed.ndim)))
+    starts = np.concatenate([[0], np.flatnonzero(changed) + 1]).astype(np.int64)
+    return RunLengthColumn(starts, values[starts], len(values))
+
+  def __len__(self):
+    return self.length
+
+  def run_of(self, i):
+    """
+    :return: the index of the run holding sample i
+    """
+    if i < 0:
+      i += self.length
+    if i < 0 or i >= self.length:
+      raise IndexError("sample index out of range")
+    return int(np.searchsorted(self.starts, i, side='right')) - 1
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      start, stop, step = i.indices(self.length)
+      if step != 1:
+        return RunLengthColumn.encode(self.expand()[i])
+      stop = max(start, stop)
+      if start == stop:
+        return RunLengthColumn(self.starts[:0], self.values[:0], 0)
+      first = self.run_of(start)
+      last = self.run_of(stop - 1)
+      starts = self.starts[first:last + 1] - start
+      starts[0] = 0
+      return RunLengthColumn(starts, self.values[first:last + 1], stop - start)
+    value = self.values[self.run_of(i)]
+    return value.tolist() if isinstance(value, np.ndarray) else value
+
+  def __iter__(self):
+    for start, stop, value in self.runs():
+      if isinstance(value, np.ndarray):
+        value = value.tolist()
+      for j in range(stop - start):
+        yield value
+
+  def __eq__(self, other):
+    try:
+      return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+    except TypeError:
+      return False
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return "RunLengthColumn(%d samples, %d runs)" % (self.length, len(self.starts))
+
+  def __array__(self, dtype=None):
+    return self.expand() if dtype is None else self.expand().astype(dtype)
+
+  def stops(self):
+    """
+    :return: array of the index after the last sample of every run
+    """
+    return np.append(self.starts[1:], self.length)
+
+  def runs(self):
+    """
+    :return: generator of (first sample, sample after the last one, value) of every run
+    """
+    for start, stop, value in zip(self.starts.tolist(), self.stops().tolist(), self.values):
+      yield start, stop, value
+
+  def expand(self):
+    """
+    :return: array of the samples
+    """
+    return np.repeat(self.values, np.diff(np.append(self.starts, self.length)), axis=0)
+
+  def tolist(self):
+    return self.expand().tolist()
+
+  def run_durations(self, timestamps, end=None):
+    """
+    :param timestamps: the times of the samples
+    :param end: the end of the last run, by default the time of the last sample
+    :return: array of the time spanned by every run, up to the first sample of the next run
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if self.length == 0:
+      return np.zeros(0)
+    bounds = np.append(timestamps[self.starts], timestamps[-1] if end is None else end)
+    return np.diff(bounds)
+
+  def nbytes(self):
+    return self.starts.nbytes + self.values.nbytes
+
+
+def as_runs(values):
+  """
+  :param values: a column, as a RunLengthColumn, an array or a list
+  :return: the column as a RunLengthColumn, encoded if needed
+  """
+  if isinstance(values, RunLengthColumn):
+    return values
+  return RunLengthColumn.encode(values)
+
+
+class EventIndex:
+  """
+  Positions of the events of every code, so that the events of one type are found by
+  binary search instead of a scan of the whole event list
+  """
+
+  def __init__(self, codes, timestamps):
+    """
+    :param codes: the event codes, in the order of the events
+    :param timestamps: sorted times of the events
+    :return:
+    """
+    codes = np.asarray(codes)
+    self.timestamps = np.asarray(timestamps, dtype=np.float64)
+    self.length = len(codes)
+    self.positions = {}
+    self.times = {}
+    order = np.argsort(codes, kind='mergesort')
+    values, firsts = np.unique(codes[order], return_index=True)
+    for code, positions in zip(values.tolist(), np.split(order, firsts[1:])):
+      self.positions[code] = positions
+      self.times[code] = self.timestamps[positions]
+
+  def __len__(self):
+    return self.length
+
+  def count(self, code):
+    """
+    :return: the number of events of code
+    """
+    return len(self.positions.get(code, ()))
+
+  def positions_of(self, code):
+    """
+    :return: sorted array of the positions of the events of code
+    """
+    return self.positions.get(code, np.zeros(0, dtype=np.int64))
+
+  def next_event(self, code, position=-1):
+    """
+    :param code: the event code
+    :param position: position of an event, -1 to search from the first one
+    :return: the position of the first event of code after position, -1 if there is none
+    """
+    positions = self.positions.get(code)
+    if positions is None:
+      return -1
+    i = int(np.searchsorted(positions, position, side='right'))
+    return int(positions[i]) if i < len(positions) else -1
+
+  def first_event(self, code, after=None):
+    """
+    :param code: the event code
+    :param after: time from which events are considered, None for the first event
+    :return: the position of the first event of code at or after time after, -1 if there is none
+    """
+    positions = self.positions.get(code)
+    if positions is None:
+      return -1
+    i = 0 if after is None else int(np.searchsorted(self.times[code], after, side='left'))
+    return int(positions[i]) if i < len(positions) else -1
+
+  def events_between(self, codes, low=None, high=None):
+    """
+    :param codes: an event code or a collection of codes
+    :param low: time of the first event, None for no lower bound
+    :param high: end of the period, excluded, None for no upper bound
+    :return: sorted array of the positions of the events of codes in [low, high)
+    """
+    if not isinstance(codes, (list, tuple, set, frozenset)):
+      codes = [codes]
+    found = []
+    for code in codes:
+      if code not in self.positions:
+        continue
+      start, stop = sample_range(self.times[code], low, high)
+      found.append(self.positions[code][start:stop])
+    if not found:
+      return np.zeros(0, dtype=np.int64)
+    return np.sort(np.concatenate(found))
+
+
+def change_dtype(dtype):
+  """
+  :param dtype: dtype of the values that change, e.g. bitrates
+  :return: the dtype of the bitrate changes of such values
+  """
+  return np.dtype([("ts", np.float64), ("direction", np.int8), ("previous", dtype), ("new", dtype)])
+
+
+def value_changes(timestamps, runs, keep):
+  """
+  Builds the changes of a piecewise-constant column at the boundaries of its runs
+  :param timestamps: the sample times
+  :param runs: the column as a RunLengthColumn
+  :param keep: boolean array, True for the runs whose start is reported. The first run,
+  which does not start with a change, never is
+  :return: structured array of change_dtype, one record per reported run start
+  """
+  k = np.flatnonzero(keep)
+  k = k[k > 0]
+  changes = np.zeros(len(k), dtype=change_dtype(runs.values.dtype))
+  changes["ts"] = np.asarray(timestamps, dtype=np.float64)[runs.starts[k]]
+  changes["previous"] = runs.values[k - 1]
+  changes["new"] = runs.values[k]
+  changes["direction"] = np.where(changes["new"] > changes["previous"], UP, DOWN)
+  return changes
+
+
+def periods(starts, ends):
+  """
+  :param starts: start times
+  :param ends: end times
+  :return: structured array of STALL_DTYPE
+  """
+  stalls = np.zeros(len(starts), dtype=STALL_DTYPE)
+  stalls["start"] = starts
+  stalls["end"] = ends
+  return stalls
+
+
+class RecordList:
+  """
+  Read-only list of dicts over a structured array, each dict being built only when it is
+  accessed. Keeps working the code written for the lists of dicts the detectors returned.
+  """
+
+  def __init__(self, records, labels=None):
+    """
+    :param records: a structured array
+    :param labels: dict of field -> dict of value -> label shown instead of the value
+    :return:
+    """
+    self.records = records
+    self.labels = labels or {}
+
+  def __len__(self):
+    return len(self.records)
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return RecordList(self.records[i], self.labels)
+    record = self.records[i]
+    d = {}
+    for name in self.records.dtype.names:
+      value = record[name].item()
+      d[name] = self.labels[name][value] if name in self.labels else value
+    return d
+
+  def __iter__(self):
+    for i in range(len(self.records)):
+      yield self[i]
+
+  def __eq__(self, other):
+    try:
+      return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+    except TypeError:
+      return False
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return repr(self.tolist())
+
+  def tolist(self):
+    return list(self)
+
+  def between(self, field, low, high):
+    """
+    :return: a RecordList of the records whose field is in [low, high)
+    """
+    values = self.records[field]
+    return RecordList(self.records[(values >= low) & (values < high)], self.labels)
+
+
+def change_records(changes):
+  """
+  :param changes: structured array of bitrate changes
+  :return: the changes as a RecordList, with "up" and "down" directions
+  """
+  return RecordList(changes, {"direction": DIRECTIONS})
@@ -0,0 +1,176 @@
+import os
+import json
+from collections import namedtuple
+
+try:
+  from os import scandir
+except ImportError:
+  try:
+    from scandir import scandir
+  except ImportError:
+    scandir = None
+
+INDEX_VERSION = 1
+
+# Metadata of a session file, taken from its name and directory without opening it
+SessionFile = namedtuple("SessionFile", ["path", "sessiontype", "ip", "date", "size", "mtime"])
+
+
+class SessionIndexError(Exception):
+  pass
+
+
+def parse_session_filename(name):
+  """
+  Splits the name of a session file, e.g. x_193522413_n_1.json
+  :param name: the file name, without directory
+  :return: a tuple (session type, ip), None if the name does not follow the pattern
+  """
+  parts = name.split('_')
+  if len(parts) < 3:
+    return None
+  return parts[2], parts[1]
+
+
+def list_dir(path):
+  """
+  :param path: the directory to list
+  :return: a tuple (list of (name, size, mtime) of the json files, list of subdirectory names)
+  """
+  files = []
+  dirs = []
+  if scandir is not None:
+    for entry in scandir(path):
+      if entry.is_dir():
+        dirs.append(entry.name)
+      elif entry.name.endswith("json") and entry.is_file():
+        st = entry.stat()
+        files.append((entry.name, st.st_size, st.st_mtime))
+  else:
+    for name in os.listdir(path):
+      full = os.path.join(path, name)
+      if os.path.isdir(full):
+        dirs.append(name)
+      elif name.endswith("json") and os.path.isfile(full):
+        st = os.stat(full)
+        files.append((name, st.st_size, st.st_mtime))
+  return files, dirs
+
+
+class SessionIndex:
+  """
+  Index of the session files under a folder, built from their names and directory
+  entries only, so that files can be selected by type, IP, date folder or size before
+  any of them is opened. The listing of every directory is kept along with its
+  modification time, and a refresh only lists again the directories that changed.
+  The index can be saved to a JSON file and reloaded by later runs.
+  """
+
+  def __init__(self, folder, recursive=True, filename=None):
+    """
+    :param folder: the root of the tree, usually holding one folder per date
+    :param recursive: index the whole tree, otherwise only the files of the direct subfolders of
+    folder, the date folders, and not the files next to them
+    :param filename: JSON file the index is loaded from if it exists, and saved to by save()
+    :return:
+    """
+    self.folder = folder
+    self.recursive = recursive
+    self.filename = filename
+    self.dirs = {}
+    self.rescanned = 0
+    if filename is not None and os.path.exists(filename):
+      self.load(filename)
+    self.refresh()
+
+  def load(self, filename):
+    """
+    Reads the directory listings of a saved index, ignored if it was built for another tree
+    :return: nothing
+    """
+    try:
+      with open(filename, 'r') as f:
+        saved = json.load(f)
+    except (IOError, ValueError) as e:
+      raise SessionIndexError("Cannot read index " + filename + ": " + str(e))
+    if saved.get("version") == INDEX_VERSION and saved.get("folder") == os.path.abspath(self.folder):
+      self.dirs = saved["dirs"]
+
+  def save(self, filename=None):
+    """
+    Writes the index, by default to the file it was loaded from
+    :return: nothing
+    """
+    filename = filename or self.filename
+    if filename is None:
+      raise SessionIndexError("No file to save the index to")
+    saved = {"version": INDEX_VERSION, "folder": os.path.abspath(self.folder), "dirs": self.dirs}
+    tmp = filename + ".tmp"
+    with open(tmp, 'w') as f:
+      json.dump(saved, f)
+    os.rename(tmp, filename)
+
+  def refresh(self):
+    """
+    Walks the tree, listing again only the directories whose modification time changed
+    :return: the number of directories listed
+    """
+    listed = 0
+    dirs = {}
+    stack = [("", 0)]
+    while stack:
+      rel, depth = stack.pop()
+      path = os.path.join(self.folder, rel)
+      try:
+        mtime = os.stat(path).st_mtime
+      except OSError:
+        continue
+      known = self.dirs.get(rel)
+      if known is None or known["mtime"] != mtime:
+        files, subdirs = list_dir(path)
+        known = {"mtime": mtime, "dirs": sorted(subdirs), "files": sorted(files)}
+        listed += 1
+      dirs[rel] = known
+      if self.recursive or depth == 0:
+        for d in known["dirs"]:
+          stack.append((os.path.join(rel, d), depth + 1))
+    self.dirs = dirs
+    self.rescanned = listed
+    return listed
+
+  def files(self):
+    """
+    :return: generator of SessionFile for every file following the naming pattern, in path order
+    """
+    for rel in sorted(self.dirs):
+      if rel == "" and not self.recursive:
+        continue
+      date = os.path.basename(rel)
+      for name, size, mtime in self.dirs[rel]["files"]:
+        meta = parse_session_filename(name)
+        if meta is not None:
+          yield SessionFile(os.path.join(self.folder, rel, name), meta[0], meta[1], date, size, mtime)
+
+  def select(self, sessiontype=None, ip=None, dates=None, min_size=None, max_size=None):
+    """
+    :param sessiontype: 'n' for netflix, 'y' for youtube, None for any
+    :param ip: part of the IP field of the file name, None for any
+    :param dates: collection of date folder names, None for any
+    :param min_size: smallest file size in bytes
+    :param max_size: largest file size in bytes
+    :return: list of the SessionFile matching all the given filters
+    """
+    selected = []
+    for f in self.files():
+      if sessiontype is not None and f.sessiontype != sessiontype:
+        continue
+      if ip is not None and ip not in f.ip:
+        continue
+      if dates is not None and f.date not in dates:
+        continue
+      if min_size is not None and f.size < min_size:
+        continue
+      if max_size is not None and f.size > max_size:
+        continue
+      selected.append(f)
+    return selected
@@ -0,0 +1,96 @@
+import numpy as np
+from session_reader import SessionReaderError, read_session_header
+
+
+class SessionIntervalsError(Exception):
+  pass
+
+
+class IntervalIndex:
+  """
+  Static index of time intervals, e.g. the sessions of a set of extension files. The intervals
+  are sorted by start, and the running maximum of their ends bounds the first interval that can
+  still reach a given time, so the intervals overlapping a query are found with two binary searches.
+  Building the index is O(n log n) and m queries cost O(m log n) plus the candidates they return,
+  which are all overlapping unless some intervals are nested in a longer one.
+  """
+
+  def __init__(self, intervals):
+    """
+    :param intervals: iterable of (start, end, item), an end before its start is taken as the start
+    :return:
+    """
+    intervals = sorted(intervals, key=lambda interval: (interval[0], interval[1]))
+    self.items = [item for start, end, item in intervals]
+    self.starts = np.array([start for start, end, item in intervals], dtype=np.float64)
+    self.ends = np.maximum(np.array([end for start, end, item in intervals], dtype=np.float64), self.starts)
+    self.reach = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+
+  def __len__(self):
+    return len(self.items)
+
+  def overlapping(self, low, high=None):
+    """
+    :param low: start of the query, absolute time
+    :param high: end of the query, None for the single time low
+    :return: list of the items whose interval overlaps [low, high], by start
+    """
+    if high is None:
+      high = low
+    queries, positions = self.overlapping_many([low], [high])
+    return [self.items[i] for i in positions]
+
+  def overlapping_many(self, lows, highs):
+    """
+    Finds all the pairs of a query and an interval overlapping each other
+    :param lows: starts of the queries
+    :param highs: ends of the queries
+    :return: a tuple (query positions, interval positions) of the overlapping pairs, grouped by query
+    """
+    lows = np.asarray(lows, dtype=np.float64)
+    highs = np.asarray(highs, dtype=np.float64)
+    if len(lows) != len(highs):
+      raise SessionIntervalsError("Got %d query starts for %d ends" % (len(lows), len(highs)))
+    # the candidates of a query start at the first interval reaching its start and stop
+    # before the first interval starting after its end
+    first = np.searchsorted(self.reach, lows, 'left')
+    stop = np.searchsorted(self.starts, highs, 'right')
+    counts = np.maximum(stop - first, 0)
+    total = counts.sum()
+    queries = np.repeat(np.arange(len(lows)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    positions = first[queries] + offsets
+    keep = self.ends[positions] >= lows[queries]
+    return queries[keep], positions[keep]
+
+
+def _header_time(header, name):
+  try:
+    return float(header[name])
+  except (KeyError, TypeError, ValueError):
+    return None
+
+
+def index_session_files(filenames, entries_key="vals"):
+  """
+  Builds an IntervalIndex of session files from the st and et fields of their headers,
+  without decoding their entries
+  :param filenames: the session files
+  :param entries_key: the key of the list of entries
+  :return: a tuple (IntervalIndex of the file paths, list of the files whose start time cannot be read)
+  """
+  intervals = []
+  unreadable = []
+  for filename in filenames:
+    try:
+      header, first = read_session_header(filename, entries_key)
+    except (IOError, SessionReaderError):
+      unreadable.append(filename)
+      continue
+    start = _header_time(header, "st")
+    if start is None:
+      unreadable.append(filename)
+      continue
+    end = _header_time(header, "et")
+    intervals.append((start, start if end is None else end, filename))
+  return IntervalIndex(intervals), unreadable
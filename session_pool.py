@@ -0,0 +1,284 @@
+import sys
+import signal
+import threading
+import multiprocessing
+import Queue
+from collections import deque
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+
+# How often the chunks in flight are checked for completion, in seconds
+POLL_INTERVAL = 0.05
+# Time allowed on top of the timeouts of the tasks in flight before they are given up, in seconds
+LOST_GRACE = 10
+
+
+class SessionPoolError(Exception):
+  pass
+
+
+class ParseTimeout(BaseException):
+  """
+  Raised by the alarm of a task that runs out of time. Like KeyboardInterrupt it is not an
+  Exception, so the broad handlers of the parsers let it through to _apply
+  """
+  pass
+
+
+def _on_alarm(signum, frame):
+  raise ParseTimeout()
+
+
+def _init_worker(memory_limit):
+  """
+  Runs once in every worker process
+  :param memory_limit: address space limit of the worker in bytes, None for no limit
+  :return: nothing
+  """
+  # interrupts are handled by the parent, which terminates the pool
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  if memory_limit is not None and resource is not None:
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def _apply(task):
+  """
+  Calls the function of a task on its file, turning failures into an error message
+  so that nothing but plain values cross the process boundary
+  :param task: a tuple (function, filename, args, timeout)
+  :return: a tuple (filename, result, error), error is None on success
+  """
+  function, filename, args, timeout = task
+  # signals can only be handled by the main thread, e.g. not while reading ahead
+  if not isinstance(threading.current_thread(), threading._MainThread):
+    timeout = None
+  if timeout:
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.alarm(timeout)
+  try:
+    return filename, function(filename, *args), None
+  except ParseTimeout:
+    return filename, None, "timed out after %d s" % timeout
+  except MemoryError:
+    return filename, None, "memory limit exceeded"
+  except Exception as e:
+    return filename, None, "%s: %s" % (type(e).__name__, e)
+  finally:
+    if timeout:
+      signal.alarm(0)
+      signal.signal(signal.SIGALRM, previous)
+
+
+def _apply_chunk(chunk):
+  return [_apply(task) for task in chunk]
+
+
+def _failed(chunk, error):
+  """
+  :return: the results of _apply for a chunk that failed as a whole
+  """
+  return [(filename, None, error) for function, filename, args, timeout in chunk]
+
+
+def _next_ready(pending, limit):
+  """
+  Waits for one of the chunks in flight to complete
+  :param pending: deque of (chunk, AsyncResult), the completed one is removed
+  :param limit: seconds after which the chunks are given up if none completes, None to wait forever
+  :return: a tuple (chunk, AsyncResult), the AsyncResult is None if the chunks were given up
+  """
+  waited = 0.0
+  while limit is None or waited < limit:
+    for i in range(len(pending)):
+      if pending[i][1].ready():
+        chunk, result = pending[i]
+        del pending[i]
+        return chunk, result
+    pending[0][1].wait(POLL_INTERVAL)
+    waited += POLL_INTERVAL
+  chunk, result = pending.popleft()
+  return chunk, None
+
+
+def _bounded(pool, tasks, chunksize, lookahead, ordered, timeout=None):
+  """
+  Submits the tasks in chunks, keeping at most lookahead tasks in flight so that
+  results do not pile up when they are consumed slower than they are produced.
+  A chunk whose result cannot be collected, e.g. a result that cannot be pickled,
+  yields an error for each of its files instead of stalling the others
+  :param timeout: seconds allowed per task. As the tasks in flight cannot take longer
+  than their timeouts together, a chunk is then given up, e.g. after its worker was
+  killed, once nothing completes for that long
+  :return: generator of the results of _apply
+  """
+  chunks = iter([tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)])
+  pending = deque()
+  lost = False
+
+  def submit():
+    for chunk in chunks:
+      pending.append((chunk, pool.apply_async(_apply_chunk, (chunk,))))
+      return
+
+  for i in range(max(1, lookahead // chunksize)):
+    submit()
+  while pending:
+    limit = None
+    if timeout:
+      limit = timeout * sum(len(chunk) for chunk, result in pending) + LOST_GRACE
+    if ordered:
+      chunk, result = pending.popleft()
+      result.wait(limit)
+      if not result.ready():
+        result = None
+    else:
+      chunk, result = _next_ready(pending, limit)
+    if result is None:
+      lost = True
+      results = _failed(chunk, "lost by its worker")
+    else:
+      try:
+        results = result.get()
+      except Exception as e:
+        results = _failed(chunk, "%s: %s" % (type(e).__name__, e))
+    submit()
+    for result in results:
+      yield result
+  if lost:
+    # the pool waits for the lost chunks when closed
+    pool.terminate()
+
+
+def read_ahead(iterable, size):
+  """
+  Consumes an iterable on a background thread, up to size items ahead of the caller
+  :param iterable: the items, e.g. sessions being parsed
+  :param size: number of items produced in advance, 0 to iterate in the caller's thread
+  :return: generator of the items of iterable, in the same order
+  """
+  if size <= 0:
+    for item in iterable:
+      yield item
+    return
+  queue = Queue.Queue(size)
+  stop = threading.Event()
+
+  def put(item):
+    while not stop.is_set():
+      try:
+        queue.put(item, timeout=0.1)
+        return True
+      except Queue.Full:
+        pass
+    return False
+
+  def produce():
+    try:
+      for item in iterable:
+        if not put((True, item)):
+          return
+      put((False, None))
+    except BaseException:
+      put((False, sys.exc_info()))
+
+  thread = threading.Thread(target=produce)
+  thread.daemon = True
+  thread.start()
+  try:
+    while True:
+      more, item = queue.get()
+      if not more:
+        if item is not None:
+          raise item[0], item[1], item[2]
+        return
+      yield item
+  finally:
+    stop.set()
+
+
+class SessionPool:
+  """
+  Applies a function to session files, either in this process or fanned out to a
+  pool of worker processes. Every file gets a timeout and workers run under a memory
+  limit, so a pathological file only costs its own result. Failures are collected in
+  errors and reported once by print_summary.
+  """
+
+  def __init__(self, jobs=1, timeout=None, memory_limit=None, chunksize=None, ordered=True):
+    """
+    :param jobs: number of worker processes, 1 parses the files in this process
+    :param timeout: seconds allowed per file, None for no limit. The alarm is only handled between
+    Python bytecodes, so it cannot interrupt a long call into C such as json.loads of a whole file
+    :param memory_limit: address space limit of each worker in bytes, None for no limit.
+    Not applied when jobs is 1, as it would constrain this process
+    :param chunksize: number of files sent to a worker at once, by default a quarter of
+    an even share of the files per worker
+    :param ordered: yield the results in the order of the files rather than as they complete
+    :return:
+    """
+    if jobs < 1:
+      raise SessionPoolError("Number of jobs must be at least 1, got " + str(jobs))
+    self.jobs = jobs
+    self.timeout = timeout
+    self.memory_limit = memory_limit
+    self.chunksize = chunksize
+    self.ordered = ordered
+    self.errors = []
+
+  def map(self, function, filenames, args=(), ordered=None, lookahead=None):
+    """
+    :param function: top level function called as function(filename, *args), picklable along with args
+    :param filenames: the files to process
+    :param args: extra arguments of the function
+    :param ordered: overrides the ordering of the pool
+    :param lookahead: most files processed ahead of the caller by the workers, None for two chunks per worker
+    :return: generator of (filename, result) for the files processed successfully
+    """
+    if ordered is None:
+      ordered = self.ordered
+    tasks = [(function, filename, args, self.timeout) for filename in filenames]
+    if self.jobs == 1 or len(tasks) <= 1:
+      results = (_apply(task) for task in tasks)
+      return self._collect(results, None)
+    if lookahead:
+      chunksize = self.chunksize or 1
+    else:
+      # two chunks in flight per worker, so that none waits for the caller
+      chunksize = self.chunksize or max(1, len(tasks) // (self.jobs * 4))
+      lookahead = 2 * self.jobs * chunksize
+    pool = multiprocessing.Pool(min(self.jobs, len(tasks)), _init_worker, (self.memory_limit,))
+    results = _bounded(pool, tasks, chunksize, lookahead, ordered, self.timeout)
+    return self._collect(results, pool)
+
+  def _collect(self, results, pool):
+    try:
+      for filename, result, error in results:
+        if error is not None:
+          self.errors.append((filename, error))
+        else:
+          yield filename, result
+    except BaseException:
+      # the consumer stopped early or was interrupted
+      if pool is not None:
+        pool.terminate()
+        pool.join()
+      raise
+    if pool is not None:
+      pool.close()
+      pool.join()
+
+  def print_summary(self, label="session"):
+    """
+    Prints the files that could not be processed and clears the errors
+    :param label: describes the files, e.g. "netflix"
+    :return: nothing
+    """
+    if self.errors:
+      print "Not possible to parse", len(self.errors), label, "files:"
+      for filename, error in sorted(self.errors):
+        print " ", filename, "because", error
+    self.errors = []
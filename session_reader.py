@@ -0,0 +1,328 @@
+import os
+import json
+import re
+import itertools
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class SessionReaderError(Exception):
+  pass
+
+
+class _Truncated(Exception):
+  pass
+
+
+class _Scanner:
+  """
+  Tokenizer over a file read chunk by chunk. Consumed input is dropped so that
+  only the value being decoded is held in memory.
+  """
+
+  def __init__(self, f, chunk_size, decoder):
+    self.f = f
+    self.chunk_size = chunk_size
+    self.decoder = decoder
+    self.buf = ""
+    self.pos = 0
+    self.eof = False
+
+  def fill(self):
+    """
+    Reads the next chunk, at least as large as the pending input so that values
+    spanning many chunks are decoded in a logarithmic number of attempts
+    """
+    if self.pos > 0:
+      self.buf = self.buf[self.pos:]
+      self.pos = 0
+    chunk = self.f.read(max(self.chunk_size, len(self.buf)))
+    if not chunk:
+      self.eof = True
+    self.buf += chunk
+
+  def peek(self):
+    """
+    :return: the next non whitespace character, without consuming it
+    """
+    while True:
+      self.pos = WHITESPACE.match(self.buf, self.pos).end()
+      if self.pos < len(self.buf):
+        return self.buf[self.pos]
+      if self.eof:
+        raise _Truncated()
+      self.fill()
+
+  def expect(self, chars):
+    """
+    Consumes the next non whitespace character
+    :param chars: the characters allowed at this point
+    :return: the character consumed
+    """
+    c = self.peek()
+    if c not in chars:
+      raise SessionReaderError("Expecting one of '%s' at offset %d, got '%s'" % (chars, self.pos, c))
+    self.pos += 1
+    return c
+
+  def value(self):
+    """
+    Decodes the next JSON value
+    """
+    self.peek()
+    while True:
+      try:
+        value, end = self.decoder.raw_decode(self.buf, self.pos)
+        # a number at the end of the buffer may continue in the next chunk
+        if end < len(self.buf) or self.eof:
+          self.pos = end
+          return value
+      except ValueError as e:
+        if self.eof:
+          raise _Truncated()
+      self.fill()
+
+
+class SessionReader:
+  """
+  Streaming reader of the JSON files written by the extensions, made of header fields
+  and a list of entries. Entries are decoded one at a time while the file is read, and
+  a truncated file yields all its complete entries.
+  """
+
+  def __init__(self, filename, entries_key="vals", chunk_size=1 << 16, object_pairs_hook=None):
+    """
+    :param filename: the JSON file to read
+    :param entries_key: the key of the list of entries
+    :param chunk_size: number of bytes read at once
+    :param object_pairs_hook: passed to the JSON decoder, e.g. OrderedDict
+    :return:
+    """
+    self.filename = filename
+    self.entries_key = entries_key
+    self.chunk_size = chunk_size
+    self.decoder = json.JSONDecoder(object_pairs_hook=object_pairs_hook)
+    self.header = {}
+    self.truncated = False
+    self.entries_read = 0
+    self._items = self._parse()
+    self._pending = None
+
+  def _parse(self):
+    with open(self.filename, 'r') as f:
+      scanner = _Scanner(f, self.chunk_size, self.decoder)
+      try:
+        scanner.expect('{')
+        if scanner.peek() == '}':
+          return
+        while True:
+          key = scanner.value()
+          scanner.expect(':')
+          if key == self.entries_key and scanner.peek() == '[':
+            scanner.expect('[')
+            if scanner.peek() == ']':
+              scanner.expect(']')
+            else:
+              while True:
+                entry = scanner.value()
+                self.entries_read += 1
+                yield entry
+                if scanner.expect(',]') == ']':
+                  break
+          else:
+            self.header[key] = scanner.value()
+          if scanner.expect(',}') == '}':
+            return
+      except _Truncated:
+        self.truncated = True
+
+  def read_header(self):
+    """
+    Reads the file up to the first entry. Fields written after the entries are
+    added to the header once the entries have been read.
+    :return: dict of the header fields
+    """
+    if self._pending is None:
+      self._pending = list(itertools.islice(self._items, 1))
+    return self.header
+
+  def first_entry(self):
+    """
+    :return: the first entry, None if there is none
+    """
+    self.read_header()
+    return self._pending[0] if self._pending else None
+
+  def entries(self):
+    """
+    :return: generator of the entries, in file order
+    """
+    self.read_header()
+    pending, self._pending = self._pending, []
+    for entry in pending:
+      yield entry
+    for entry in self._items:
+      yield entry
+
+  def close(self):
+    """
+    Closes the file before all the entries have been read
+    :return: nothing
+    """
+    self._items.close()
+
+
+def _parse_trailer(tail):
+  """
+  :param tail: the end of a session file
+  :return: dict of the fields after the list of entries, None if tail does not hold its end
+  """
+  end = len(tail)
+  while True:
+    end = tail.rfind(']', 0, end)
+    if end < 0:
+      return None
+    rest = tail[end + 1:].lstrip()
+    if rest.startswith(','):
+      rest = rest[1:]
+    elif not rest.startswith('}'):
+      continue
+    try:
+      fields = json.loads('{' + rest)
+    except ValueError:
+      continue
+    if isinstance(fields, dict):
+      return fields
+
+
+def read_trailer(filename, size=1 << 12):
+  """
+  Reads the fields written after the list of entries from the end of the file, e.g. the
+  header of the youtube files
+  :param filename: the JSON file to read
+  :param size: number of bytes read first, doubled until the end of the entries is found
+  :return: dict of the fields, empty if there are none or the file is truncated
+  """
+  with open(filename, 'r') as f:
+    f.seek(0, os.SEEK_END)
+    length = f.tell()
+    while True:
+      f.seek(max(0, length - size))
+      fields = _parse_trailer(f.read())
+      if fields is not None or size >= length:
+        return fields or {}
+      size *= 2
+
+
+def read_session_header(filename, entries_key="vals", chunk_size=1 << 12):
+  """
+  Reads the header of a session file without decoding its entries: the fields before the
+  entries, the first entry, and the fields after the entries taken from the end of the file
+  :param filename: the JSON file to read
+  :param entries_key: the key of the list of entries
+  :param chunk_size: number of bytes read at once
+  :return: a tuple (dict of the header fields, first entry or None)
+  """
+  reader = SessionReader(filename, entries_key, chunk_size)
+  header = dict(reader.read_header())
+  first = reader.first_entry()
+  reader.close()
+  # the header is complete unless the reading stopped in the entries
+  if first is not None:
+    header.update(read_trailer(filename, chunk_size))
+  return header, first
+
+
+def _number(value):
+  try:
+    return float(value)
+  except (TypeError, ValueError):
+    return None
+
+
+class HeaderFilter:
+  """
+  Predicates on the header of session files, evaluated before the files are parsed so that
+  only the relevant ones are read in full
+  """
+
+  def __init__(self, mids=None, start=None, end=None, useragent=None, versions=None):
+    """
+    :param mids: collection of movie ids, None for any
+    :param start: absolute time in ms, sessions ending before it are rejected
+    :param end: absolute time in ms, sessions starting at or after it are rejected
+    :param useragent: part of the user agent of the first entry, None for any
+    :param versions: collection of extension versions, from the v header field or the V
+    field of the first entry, None for any
+    :return:
+    """
+    self.mids = None if mids is None else set(str(mid) for mid in mids)
+    self.start = start
+    self.end = end
+    self.useragent = useragent
+    self.versions = None if versions is None else set(str(version) for version in versions)
+
+  def matches(self, header, first=None):
+    """
+    :param header: dict of the header fields
+    :param first: the first entry, None if there is none
+    :return: True if the session passes all the predicates
+    """
+    first = first or {}
+    if self.mids is not None and str(header.get("mid")) not in self.mids:
+      return False
+    st = _number(header.get("st"))
+    et = _number(header.get("et"))
+    if et is None:
+      et = st
+    if self.start is not None and (et is None or et < self.start):
+      return False
+    if self.end is not None and (st is None or st >= self.end):
+      return False
+    if self.useragent is not None and self.useragent not in first.get("UA", ""):
+      return False
+    version = header.get("v", first.get("V"))
+    if self.versions is not None and (version is None or str(version) not in self.versions):
+      return False
+    return True
+
+  def select(self, filenames):
+    """
+    :param filenames: the session files
+    :return: list of the files whose header matches, files whose header cannot be read are left out
+    """
+    selected = []
+    for filename in filenames:
+      try:
+        header, first = read_session_header(filename)
+      except (IOError, SessionReaderError):
+        continue
+      if self.matches(header, first):
+        selected.append(filename)
+    return selected
+
+
+def iter_items(filename, chunk_size=1 << 16, object_pairs_hook=None):
+  """
+  Streams the members of a file holding one JSON object, e.g. the request history of the
+  browser, so that only one member at a time is held in memory
+  :param filename: the JSON file to read
+  :param chunk_size: number of bytes read at once
+  :param object_pairs_hook: passed to the JSON decoder, e.g. OrderedDict
+  :return: generator of (key, value), stopping at the last complete member of a truncated file
+  """
+  decoder = json.JSONDecoder(object_pairs_hook=object_pairs_hook)
+  with open(filename, 'r') as f:
+    scanner = _Scanner(f, chunk_size, decoder)
+    try:
+      scanner.expect('{')
+      if scanner.peek() == '}':
+        return
+      while True:
+        key = scanner.value()
+        scanner.expect(':')
+        yield key, scanner.value()
+        if scanner.expect(',}') == '}':
+          return
+    except _Truncated:
+      return
@@ -0,0 +1,205 @@
+import numpy as np
+from session_columns import forward_fill
+
+# What to store for a sample when its key is missing or its value cannot be parsed
+FILL_PREVIOUS = "previous"
+FILL_DEFAULT = "default"
+
+# Marks a key absent from an entry, as opposed to a key holding null
+_ABSENT = object()
+
+
+class Field:
+  """
+  Declares how one key of the extension entries is decoded into columns
+  """
+
+  def __init__(self, key, parser, columns, missing=FILL_PREVIOUS, invalid=FILL_PREVIOUS,
+               errors=(ValueError,), required=False):
+    """
+    :param key: the key of the entry
+    :param parser: function of the raw value returning one value per column. A value of None
+    leaves that column to the missing policy, raising KeyError does the same for all columns
+    :param columns: a Column or a list of Columns filled by the parser
+    :param missing: FILL_PREVIOUS or FILL_DEFAULT, used when the key is absent. A key holding null
+    is not absent, the parser gets None
+    :param invalid: FILL_PREVIOUS or FILL_DEFAULT, used when the parser raises one of errors
+    :param errors: exceptions of the parser handled by the invalid policy, others propagate
+    :param required: raise KeyError when the key is absent
+    :return:
+    """
+    self.key = key
+    self.parser = parser
+    self.single = not isinstance(columns, (list, tuple))
+    self.columns = [columns] if self.single else list(columns)
+    self.missing = missing
+    self.invalid = invalid
+    self.errors = errors
+    self.required = required
+
+
+class SessionSchema:
+  """
+  A list of Fields compiled into a single decoding loop. Every entry is visited once,
+  each key is looked up and parsed once, and missing values are forward filled with
+  a vectorized pass once all the entries have been read.
+  """
+
+  def __init__(self, fields):
+    self.fields = fields
+    self.projections = {}
+    self.columns = []
+    index = {}
+    self.plan = []
+    for field in fields:
+      slots = []
+      for column in field.columns:
+        if column.name not in index:
+          index[column.name] = len(self.columns)
+          self.columns.append(column)
+        slots.append(index[column.name])
+      parser = field.parser
+      if field.single:
+        parser = _tuple_result(parser)
+      self.plan.append((field.key, field.parser, parser, field.single, tuple(slots),
+                        field.missing, field.invalid, field.errors, field.required))
+
+  def project(self, names):
+    """
+    :param names: the names of the columns to decode
+    :return: a SessionSchema of the required fields and of the fields filling one of these columns,
+    along with the other columns these fields fill
+    """
+    key = frozenset(names)
+    if key not in self.projections:
+      self.projections[key] = SessionSchema([field for field in self.fields if field.required or
+                                             any(column.name in key for column in field.columns)])
+    return self.projections[key]
+
+  def decode(self, entries, size=None, compact=True):
+    """
+    Decodes entries into one array per column
+    :param entries: iterable of entry dicts
+    :param size: expected number of entries, if known
+    :param compact: store the columns with their columnar dtype
+    :return: a tuple (dict of column name -> array, dict of categorical column name -> labels)
+    """
+    columns = self.columns
+    capacity = size if size else 1024
+    datas = [c.alloc(capacity, compact) for c in columns]
+    presents = [np.zeros(capacity, dtype=bool) for c in columns]
+    defaults = [0 if c.categorical else c.default for c in columns]
+    codes = [{"": 0} if c.categorical else None for c in columns]
+    plan = self._bind(datas, presents, defaults, codes)
+    n = 0
+    for entry in entries:
+      if n == capacity:
+        capacity *= 2
+        for j in range(len(columns)):
+          datas[j] = _grow(datas[j], capacity)
+          presents[j] = _grow(presents[j], capacity)
+        plan = self._bind(datas, presents, defaults, codes)
+      for key, parser, direct, targets, missing, invalid, errors, required in plan:
+        raw = entry.get(key, _ABSENT)
+        if raw is _ABSENT:
+          if required:
+            raise KeyError(key)
+          policy = missing
+        else:
+          try:
+            values = parser(raw)
+            policy = None
+          except KeyError:
+            policy = missing
+          except errors:
+            policy = invalid
+        if policy is None:
+          if direct is not None:
+            if values is not None:
+              direct[0][n] = values
+              direct[1][n] = True
+            continue
+          for (data, present, default, labels), value in zip(targets, values):
+            if value is None:
+              continue
+            if labels is not None:
+              value = labels.setdefault(value, len(labels))
+            data[n] = value
+            present[n] = True
+        elif policy == FILL_DEFAULT:
+          for data, present, default, labels in targets:
+            data[n] = default
+            present[n] = True
+      n += 1
+
+    decoded = {}
+    categories = {}
+    for j, column in enumerate(columns):
+      data = datas[j][:n] if n == capacity else datas[j][:n].copy()
+      decoded[column.name] = forward_fill(data, presents[j][:n], defaults[j])
+      if column.categorical:
+        labels = [None] * len(codes[j])
+        for label, code in codes[j].items():
+          labels[code] = label
+        categories[column.name] = labels
+    return decoded, categories
+
+  def _bind(self, datas, presents, defaults, codes):
+    """
+    Resolves the columns of every field to the arrays being filled
+    :return: the decoding plan, one tuple per field
+    """
+    plan = []
+    for key, parser, tupleParser, single, slots, missing, invalid, errors, required in self.plan:
+      targets = [(datas[j], presents[j], defaults[j], codes[j]) for j in slots]
+      direct = None
+      if single and codes[slots[0]] is None:
+        direct = targets[0]
+      elif single:
+        parser = tupleParser
+      plan.append((key, parser, direct, targets, missing, invalid, errors, required))
+    return plan
+
+
+def resolve_columns(names, dependencies, always=()):
+  """
+  :param names: the columns and derived attributes requested
+  :param dependencies: dict of derived attribute -> the columns and attributes it is computed from
+  :param always: columns needed whatever is requested
+  :return: set of the columns the requested names are computed from
+  """
+  columns = set(always)
+  seen = set()
+  pending = list(names)
+  while pending:
+    name = pending.pop()
+    if name in seen:
+      continue
+    seen.add(name)
+    if name in dependencies:
+      pending.extend(dependencies[name])
+    else:
+      columns.add(name)
+  return columns
+
+
+def _grow(data, capacity):
+  grown = np.zeros((capacity,) + data.shape[1:], dtype=data.dtype)
+  grown[:len(data)] = data
+  return grown
+
+
+def _tuple_result(parser):
+  def parse(value):
+    return (parser(value),)
+  return parse
+
+
+def non_empty(value):
+  """
+  Parser keeping the raw value, empty values count as missing
+  """
+  if not value:
+    raise KeyError()
+  return value
+
@@ -1,5 +1,11 @@
-import json
+import copy
 from collections import OrderedDict
+import numpy as np
+from session_columns import Column, RangeTable, EventIndex, RunLengthColumn, RecordList, as_runs, value_changes, \
+  periods, change_records, value_at, sample_range, values_at, NEAREST
+from session_schema import Field, SessionSchema, FILL_DEFAULT, resolve_columns, non_empty
+from session_reader import SessionReader, SessionReaderError
+from session_cache import SessionCacheError
 
 # YPR: available video rates ["hd2160","hd1440","hd1080","hd720","large","medium","small","tiny","auto"]
 # BUF: rangesToString(video.buffered),
@@ -53,18 +59,70 @@ from collections import OrderedDict
 #     "waiting": 22 // waiting	Fires when the video stops because it needs to buffer the next frame
 # };
 
+# Bitrate in Mbps of the SDR uploads of every height
+VIDEO_RATES = {2160: 40, 1440: 16, 1080: 8, 720: 5, 480: 2.5, 360: 1, 240: 0.5, 144: 0.25}
+
+
 class YoutubeSessionError(Exception):
   pass
 
+
 class YoutubeSession:
 
   TS_GRANULARITY = 500
 
-  def __init__(self, filename = None):
+  # Ranges are kept as strings while decoding and parsed all at once afterwards
+  SCHEMA = SessionSchema([
+    Field("ts", int, Column("timeStamps", np.float64), required=True),
+    Field("BUF", non_empty, Column("buffer", object, default=None)),
+    Field("VHE", int, Column("videoHeights", np.int16)),
+    Field("VWI", int, Column("videoWidths", np.int16)),
+    Field("CUT", float, Column("currentTimes", np.float64)),
+    Field("RST", int, Column("readyStates", np.int8)),
+    Field("WVD", int, Column("webkitVideoDecodedByteCount", np.int64)),
+    Field("DUR", int, Column("durations", np.int32), missing=FILL_DEFAULT, invalid=FILL_DEFAULT,
+          errors=(TypeError,)),
+  ])
+  # Per-sample columns, sliced together when the session is trimmed
+  SAMPLE_COLUMNS = ("timeStamps", "readyStates", "buffer", "bufferDurations", "bufferedPosition", "currentTimes",
+                    "position", "videoWidths", "videoHeights", "videoRates", "resolution", "durations",
+                    "webkitAudioDecodedByteCount", "webkitVideoDecodedByteCount")
+  # Piecewise-constant columns, stored as runs in columnar mode
+  RUN_LENGTH_COLUMNS = ("videoHeights", "videoWidths", "readyStates")
+  # Fields other than the columns saved in the parse cache
+  STATE_FIELDS = ("startTime", "endTime", "mid", "version", "isAborted", "truncated", "malformedBuffers", "events",
+                  "eventsTimeStamps", "joinTime")
+  # Detected periods and changes, saved in the parse cache as structured arrays
+  RECORD_FIELDS = ("bitrateChanges", "stalls")
+  # Attributes computed on their first access, by the method filling them
+  DERIVED = {"videoRates": "add_video_rates", "bufferDurations": "add_buffer_durations",
+             "bufferedPosition": "add_buffer_durations", "joinTime": "gen_join_time",
+             "bitrateChanges": "gen_bitrate_changes", "stalls": "gen_empty_buffers"}
+  # Columns and attributes every derived attribute is computed from
+  DEPENDENCIES = {"videoRates": ("videoHeights",), "bufferDurations": ("buffer", "currentTimes"),
+                  "bufferedPosition": ("buffer", "currentTimes"), "joinTime": (), "stalls": (),
+                  "bitrateChanges": ("videoHeights", "joinTime")}
+  # Columns decoded whatever the projection, the buffers are needed to drop the video played before an abort
+  ALWAYS = ("timeStamps", "buffer")
+
+  def __init__(self, filename = None, columnar=False, cache=None, fields=None):
     """
     Initialize empty stats structure
+    :param filename: the JSON file to parse
+    :param columnar: store the per-sample metrics in typed NumPy arrays instead of lists
+    :param cache: a SessionCache to load the parsed session from, or to store it in
+    :param fields: the columns and derived attributes needed, only the columns they are computed
+    from are decoded. None decodes every column. Sessions parsed with a projection read the cache
+    but are not stored in it
     :return:
     """
+    self.columnar = columnar
+    self.projection = None
+    if fields is not None:
+      self.projection = resolve_columns(fields, YoutubeSession.DEPENDENCIES, YoutubeSession.ALWAYS)
+      unknown = self.projection - set(column.name for column in YoutubeSession.SCHEMA.columns)
+      if unknown:
+        raise YoutubeSessionError("Unknown fields: " + ", ".join(sorted(unknown)))
     self.mid = ""
     self.startTime = 0
     self.endTime = 0
@@ -72,182 +130,246 @@ class YoutubeSession:
     self.timeStamps = []
     self.readyStates = []
     self.buffer = []
-    self.bufferDurations = []
     self.currentTimes = []
     self.position = []
     self.videoWidths = []
     self.videoHeights = []
-    self.videoRates = []
     self.resolution = []
     self.webkitAudioDecodedByteCount = []
     self.webkitVideoDecodedByteCount = []
     self.events = []
     self.eventsTimeStamps = []
-    self.bitrateChanges = []
-    self.stalls = []
-    self.joinTime = 0
+    self.eventIndex = EventIndex([], [])
     self.version = None
     self.isAborted = False
+    self.truncated = False
+    self.malformedBuffers = []
     if filename is not None:
-      self.processed_succesfully = self.process_youtube_session(filename)
+      self.processed_succesfully = self.process_youtube_session(filename, cache=cache)
     else:
       raise YoutubeSessionError("Unparsable JSON file")
 
+  def __getattr__(self, name):
+    """
+    Computes a derived attribute on its first access, it is then stored on the session
+    """
+    method = YoutubeSession.DERIVED.get(name)
+    if method is None:
+      raise AttributeError(name)
+    if self.projection is not None and not self.projection.issuperset(
+        resolve_columns([name], YoutubeSession.DEPENDENCIES)):
+      raise YoutubeSessionError(name + " depends on columns that were not parsed")
+    getattr(self, method)()
+    return self.__dict__[name]
+
+  def invalidate(self, names=None):
+    """
+    Drops derived attributes so that they are computed again on their next access, to be
+    called after changing the columns they are computed from
+    :param names: the attributes to drop, by default all the derived ones
+    :return: nothing
+    """
+    for name in names or YoutubeSession.DERIVED:
+      self.__dict__.pop(name, None)
 
-  def process_youtube_session(self, filename):
+  def process_youtube_session(self, filename, cache=None):
     """
     Function that gets a json file and return it parsed into an
     :param filename: the JSON file to parse
+    :param cache: a SessionCache to load the parsed session from, or to store it in
     :return: the parsed
     """
+    if filename is not None:
+      self.filename = filename
+    if cache is not None and self.load_cached(cache):
+      return True
+    reader = SessionReader(self.filename)
     try:
-      if filename is not None:
-        self.filename = filename
-      with open(self.filename, 'r') as f:
-        string = f.read()
-        f.close()
-      dataset = json.loads(string)
-    except Exception as e:
-      raise YoutubeSessionError("Bad JSON file: " + e.message)
-    try:
+      columns, _ = self.schema().decode(self.split_events(reader.entries()), compact=self.columnar)
+      self.truncated = reader.truncated
+      dataset = reader.header
       self.startTime = float(dataset["st"])
       self.endTime = float(dataset["et"])
       if "v" in dataset:
         self.version = dataset["v"]
       self.mid = dataset["mid"]
-
-      for entry in dataset["vals"]:
-        ts = int(entry["ts"]) - self.startTime
-        if not self.add_event(entry, ts):
-          self.timeStamps.append(ts)
-          self.add_buffer(entry)
-          self.add_video_height(entry)
-          self.add_video_width(entry)
-          self.add_currentTime_video(entry)
-          self.add_ready_state(entry)
-          self.add_decoded_video_bytes(entry)
-          self.add_duration(entry)
-      self.add_video_rates()
-      self.add_buffer_durations()
+      columns["timeStamps"] -= self.startTime
+      self.eventsTimeStamps = [ts - self.startTime for ts in self.eventsTimeStamps]
+      self.index_events()
+      self.buffer, malformed = RangeTable.from_strings(columns.pop("buffer"), default=[(0, 0)])
+      self.malformedBuffers = columns["timeStamps"][malformed].tolist()
+      self.set_columns(columns)
       self.throw_last_video()
-      self.gen_join_time()
-      self.gen_bitrate_changes()
-      self.gen_empty_buffers()
+      if cache is not None and self.projection is None:
+        self.store_cached(cache)
       return True
 
+    except (IOError, SessionReaderError) as e:
+      raise YoutubeSessionError("Bad JSON file: " + str(e))
     except KeyError as ke:
       raise YoutubeSessionError("Bad JSON file: " + ke.message)
 
 
-  def get_height_by_time(self, t):
+  def split_events(self, entries):
+    """
+    Records the player events, with absolute timestamps, and yields the other entries,
+    which are the samples
+    :param entries: the entries of the session file
+    :return: generator of sample entries
+    """
+    for entry in entries:
+      ts = int(entry["ts"])
+      if "EVE" not in entry:
+        yield entry
+        continue
+      try:
+        event = int(entry["EVE"])
+        self.events.append(event)
+        self.eventsTimeStamps.append(ts)
+      except ValueError as e:
+        print 'Error when parsing an event: ' + e.message
+
+  def set_columns(self, columns):
+    """
+    Stores decoded columns on the session, as arrays or runs in columnar mode and as lists otherwise
+    :param columns: dict of column name -> array
+    :return: nothing
+    """
+    for name, values in columns.items():
+      if not self.columnar:
+        values = values.tolist()
+      elif name in YoutubeSession.RUN_LENGTH_COLUMNS:
+        values = RunLengthColumn.encode(values)
+      setattr(self, name, values)
+
+
+  def schema(self):
+    """
+    :return: the schema decoding the columns of the projection of the session
+    """
+    if self.projection is None:
+      return YoutubeSession.SCHEMA
+    return YoutubeSession.SCHEMA.project(self.projection)
+
+  def cache_kind(self):
+    """
+    :return: the key of the session type and storage mode in the parse cache
+    """
+    return "YoutubeSession:" + ("columnar" if self.columnar else "lists")
+
+  def load_cached(self, cache):
+    """
+    Restores the session from the parse cache
+    :param cache: a SessionCache
+    :return: True on a hit
+    """
+    cached = cache.load(self.filename, self.cache_kind())
+    if cached is None:
+      return False
+    columns, fields = cached
+    for name, value in fields.items():
+      setattr(self, name, value)
+    self.buffer = RangeTable(columns.pop("bufferIndex"), columns.pop("bufferOffsets"),
+                             columns.pop("bufferStarts"), columns.pop("bufferEnds"))
+    self.bitrateChanges = change_records(columns.pop("bitrateChanges"))
+    self.stalls = RecordList(columns.pop("stalls"))
+    self.set_columns(columns)
+    self.index_events()
+    return True
+
+  def store_cached(self, cache):
+    """
+    Saves the parsed session to the parse cache. The cache is best effort, failing to
+    write to it does not fail the parsing.
+    :param cache: a SessionCache
+    :return: nothing
+    """
+    fields = dict((name, getattr(self, name)) for name in YoutubeSession.STATE_FIELDS)
+    columns = {
+      "bufferDurations": np.asarray(self.bufferDurations, dtype=np.float64),
+      "bufferedPosition": np.asarray(self.bufferedPosition, dtype=bool),
+      "bufferIndex": self.buffer.index,
+      "bufferOffsets": self.buffer.offsets,
+      "bufferStarts": self.buffer.starts,
+      "bufferEnds": self.buffer.ends,
+    }
+    for name in YoutubeSession.RECORD_FIELDS:
+      columns[name] = getattr(self, name).records
+    for column in YoutubeSession.SCHEMA.columns:
+      if column.name != "buffer":
+        columns[column.name] = np.asarray(getattr(self, column.name), dtype=column.storage_dtype(self.columnar))
+    try:
+      cache.store(self.filename, self.cache_kind(), columns, fields)
+    except SessionCacheError:
+      pass
+
+  def value_by_time(self, values, t, mode=NEAREST):
+    """
+    Looks up a column at time t by binary search on the timestamps of the samples
+    :param values: the column, e.g. self.timeStamps
+    :param t: absolute time, on the scale of startTime
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
+    :return: the value, None if t is more than one sampling period away from the samples
+    """
+    return value_at(self.timeStamps, values, t - self.startTime, mode, YoutubeSession.TS_GRANULARITY)
+
+  def values_by_times(self, times, names=("timeStamps", "buffer", "currentTimes"), mode=NEAREST):
+    """
+    Batch version of value_by_time, looking up several columns at many times with one binary search pass
+    :param times: absolute times, on the scale of startTime
+    :param names: the attributes of the columns to look up
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
+    :return: dict of column name -> list of its values at times, None where there is no sample
+    """
+    relative = np.asarray(times, dtype=np.float64) - self.startTime
+    columns = [getattr(self, name) for name in names]
+    values = values_at(self.timeStamps, columns, relative, mode, YoutubeSession.TS_GRANULARITY)
+    return dict(zip(names, values))
+
+  def get_height_by_time(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/500)
-    if i >= len(self.videoHeights):
-      return None
-    return self.videoHeights[i]
-
-
-  def add_video_height(self, entry):
-    try:
-      h = int(entry["VHE"])
-      self.videoHeights.append(h)
-    except KeyError:
-      if len(self.videoHeights) > 0:
-        self.videoHeights.append(self.videoHeights[-1])
-      else:
-        self.videoHeights.append(0)
-    except ValueError as e:
-      if len(self.videoHeights) > 0:
-        self.videoHeights.append(self.videoHeights[-1])
-      else:
-        self.videoHeights.append(0)
+    return self.value_by_time(self.videoHeights, t, mode)
 
 
   def get_video_heights(self):
     return self.videoHeights
 
 
-  def add_video_width(self, entry):
-    try:
-      w = int(entry["VWI"])
-      self.videoWidths.append(w)
-    except KeyError:
-      if len(self.videoWidths) > 0:
-        self.videoWidths.append(self.videoWidths[-1])
-      else:
-        self.videoWidths.append(0)
-    except ValueError as e:
-      if len(self.videoWidths) > 0:
-        self.videoWidths.append(self.videoWidths[-1])
-      else:
-        self.videoWidths.append(0)
-
-
   def get_video_widths(self):
     return self.videoWidths
 
 
   def add_video_rates(self):
     # from https://support.google.com/youtube/answer/1722171?hl=en (SDR uploads)
-    widths = self.get_video_widths()
-    heights = self.get_video_heights()
-
-    for i in range(len(heights)):
-      if heights[i] == 2160:
-        self.videoRates.append(40)
-      elif heights[i] == 1440:
-        self.videoRates.append(16)
-      elif heights[i] == 1080:
-        self.videoRates.append(8)
-      elif heights[i] == 720:
-        self.videoRates.append(5)
-      elif heights[i] == 480:
-        self.videoRates.append(2.5)
-      elif heights[i] == 360:
-        self.videoRates.append(1)
-      elif heights[i] == 240:
-        self.videoRates.append(0.5)
-      elif heights[i] == 144:
-        self.videoRates.append(0.25)
-      else:
-        self.videoRates.append(0)
-
-
-  def add_duration(self, entry):
-    try:
-      h = int(entry["DUR"])
-      self.durations.append(h)
-    except TypeError:
-      self.durations.append(0)
-      return None
-    except KeyError:
-      self.durations.append(0)
-      return None
+    self.videoRates = [VIDEO_RATES.get(height, 0) for height in self.get_video_heights()]
 
 
   def get_durations(self):
     return self.durations
 
-  def get_duration_by_time(self, t):
+  def get_video_duration(self):
+    """
+    :return: the duration of the video reported by the last sample, 0 without samples
+    """
+    if len(self.durations) == 0:
+      return 0
+    return self.durations[-1]
+
+  def get_duration_by_time(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/500)
-    if i >= len(self.currentTimes):
-      return None
-    return self.durations[i]
+    return self.value_by_time(self.durations, t, mode)
 
 
   def get_duration_by_index(self, i):
@@ -260,38 +382,18 @@ class YoutubeSession:
     return self.durations[i]
 
 
-  def add_currentTime_video(self, entry):
-    try:
-      ct = float(entry["CUT"])
-      self.currentTimes.append(ct)
-    except KeyError:
-      if len(self.currentTimes) == 0:
-        self.currentTimes.append(0)
-      else:
-        self.currentTimes.append(self.currentTimes[-1])
-    except ValueError as e:
-      if len(self.currentTimes) == 0:
-        self.currentTimes.append(0)
-      else:
-        self.currentTimes.append(self.currentTimes[-1])
-
-
   def get_currentTimes_video(self):
     return self.currentTimes
 
-  def get_currentTimes_by_time(self, t):
+  def get_currentTimes_by_time(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/500)
-    if i >= len(self.currentTimes):
-      return None
-    return self.currentTimes[i]
+    return self.value_by_time(self.currentTimes, t, mode)
 
 
   def get_currentTimes_by_index(self, i):
@@ -308,53 +410,18 @@ class YoutubeSession:
     return self.videoRates
 
 
-  def add_buffer(self, entry):
-    try:
-      bufferE = entry["BUF"]
-      if not bufferE:
-        raise KeyError()
-
-      if self.version is not None:
-        buffer = bufferE[2:-2]
-      else:
-        buffer = bufferE[2:-1]
-      parts = buffer.split('},{')
-
-      buffer = []
-      for part in parts:
-        bounds = part.split(',')
-        beginning = float(bounds[0][2:])
-        end = float(bounds[1][2:])
-        buffer.append((beginning, end))
-      self.buffer.append(buffer)
-    except KeyError as e:
-      if len(self.buffer) == 0:
-        self.buffer.append([(0, 0)])
-      else:
-        self.buffer.append(self.buffer[-1])
-    except ValueError as e:
-      if len(self.buffer) == 0:
-        self.buffer.append([(0, 0)])
-      else:
-        self.buffer.append(self.buffer[-1])
-
-
   def get_buffer(self):
     return self.buffer
 
-  def get_buffer_by_time(self, t):
+  def get_buffer_by_time(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/500)
-    if i >= len(self.buffer):
-      return None
-    return self.buffer[i]
+    return self.value_by_time(self.buffer, t, mode)
 
 
   def get_buffer_by_index(self, i):
@@ -368,32 +435,36 @@ class YoutubeSession:
 
 
   def add_buffer_durations(self):
-    for i in range(len(self.buffer)):
-      dur = None
-      for bufferPart in self.buffer[i]:
-        start = bufferPart[0]
-        end = bufferPart[1]
-        if start <= self.currentTimes[i] <= end:
-          dur = end - self.currentTimes[i]
-          self.bufferDurations.append(dur)
-          break
-      if dur is None:
-        maxEnd = max(self.buffer[i], key=lambda tup: tup[1])[1]
-        self.bufferDurations.append(maxEnd - self.currentTimes[i])
-
-      #self.bufferDurations.append(dur if dur >= 0 else 0)
+    """
+    Computes the buffer ahead of the current time of every sample: up to the end of the buffered
+    range holding it, or up to the furthest buffered range if it is not buffered
+    :return: nothing
+    """
+    durations, buffered = self.buffer.forward_lengths(self.currentTimes)
+    self.bufferDurations = durations if self.columnar else durations.tolist()
+    self.bufferedPosition = buffered if self.columnar else buffered.tolist()
 
 
   def get_buffer_durations(self):
     return self.bufferDurations
 
 
+  def get_buffering_flags(self, threshold=0):
+    """
+    :param threshold: seconds of buffer ahead at or below which playback is starved
+    :return: boolean array, True for the samples that are buffering: starved or at a position outside
+    the buffered ranges
+    """
+    durations = np.asarray(self.bufferDurations, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+      starved = ~(durations > threshold)
+    return starved | ~np.asarray(self.bufferedPosition, dtype=bool)
+
   def check_if_buffering(self):
-    bufferEvents = []
-    for i in range(len(self.buffer)):
-      if self.bufferDurations[i] == 0 or not (self.buffer[i][0] <= self.currentTimes[i] <= self.buffer[i][1]):
-        bufferEvents.append(i)
-    return bufferEvents
+    """
+    :return: list of the indices of the samples that are buffering
+    """
+    return np.flatnonzero(self.get_buffering_flags()).tolist()
 
 
   def get_timestamps(self):
@@ -404,33 +475,25 @@ class YoutubeSession:
     """
     return self.timeStamps
 
-  def get_timestamp_by_time(self, t):
+  def get_timestamp_by_time(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/500)
-    if i >= len(self.timeStamps):
-      return None
-    return self.timeStamps[i]
+    return self.value_by_time(self.timeStamps, t, mode)
 
-  def get_timestamp_by_time_s(self, t):
+  def get_timestamp_by_time_s(self, t, mode=NEAREST):
     """
     Return the closest entry to timestamp t
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime*1000)/YoutubeSession.TS_GRANULARITY)
-    if i >= len(self.timeStamps):
-      return None
-    return self.timeStamps[i]
+    return value_at(self.timeStamps, self.timeStamps, t - self.startTime*1000, mode, YoutubeSession.TS_GRANULARITY)
 
 
   def get_timestamp_by_index(self, i):
@@ -467,19 +530,15 @@ class YoutubeSession:
     """
     return self.resolution
 
-  def get_resolution_by_time(self, t):
+  def get_resolution_by_time(self, t, mode=NEAREST):
     """
 
     :param self:
     :param t:
+    :param mode: PREVIOUS, NEXT, NEAREST or INTERPOLATE, see value_at
     :return:
     """
-    if t<=0 or t<=self.startTime:
-      return None
-    i = int((t-self.startTime)/YoutubeSession.TS_GRANULARITY)
-    if i >= len(self.resolution):
-      return None
-    return self.resolution[i]
+    return self.value_by_time(self.resolution, t, mode)
 
   def get_resolution_by_index(self, i):
     """
@@ -490,149 +549,154 @@ class YoutubeSession:
     """
     return self.resolution[i]
 
-  def add_event(self, entry, ts):
-    try:
-      event = int(entry["EVE"])
-      self.events.append(event)
-      self.eventsTimeStamps.append(ts)
-      return True
-    except KeyError:
-      return False
-    except ValueError as e:
-      print 'Error when parsing an event: ' + e.message
-      return True
-
-
-  def add_ready_state(self, entry):
-    try:
-      rst = int(entry["RST"])
-      self.readyStates.append(rst)
-    except KeyError:
-      if len(self.readyStates) == 0:
-        self.readyStates.append(0)
-      else:
-        self.readyStates.append(self.readyStates[-1])
-    except ValueError as e:
-      if len(self.readyStates) == 0:
-        self.readyStates.append(0)
-      else:
-        self.readyStates.append(self.readyStates[-1])
-
   def get_ready_states(self):
     return self.readyStates
 
-  def add_decoded_video_bytes(self, entry):
-    try:
-      decVidBytes = int(entry["WVD"])
-      self.webkitVideoDecodedByteCount.append(decVidBytes)
-    except KeyError:
-      if (len(self.webkitVideoDecodedByteCount) == 0):
-        self.webkitVideoDecodedByteCount.append(0)
-      else:
-        self.webkitVideoDecodedByteCount.append(self.webkitVideoDecodedByteCount[-1])
-    except ValueError as e:
-      if (len(self.webkitVideoDecodedByteCount) == 0):
-        self.webkitVideoDecodedByteCount.append(0)
-      else:
-        self.webkitVideoDecodedByteCount.append(self.webkitVideoDecodedByteCount[-1])
-
   def get_decoded_video_bytes(self):
     return self.webkitVideoDecodedByteCount
 
   def get_abort_event_index(self):
     try:
-      abortIdx = self.events.index(1)
-      if self.timeStamps[abortIdx] - self.timeStamps[0] <= 20 and abortIdx < len(self.events) - 1:
+      abortIdx = self.eventIndex.first_event(1)
+      if abortIdx >= 0 and self.timeStamps[abortIdx] - self.timeStamps[0] <= 20 and abortIdx < len(self.events) - 1:
         return abortIdx
       else:
         return -1
-    except:
+    except Exception:
       return -1
 
   def get_buffer_change_index(self, start):
-    for i in range(start, len(self.buffer) - 1):
-      if self.buffer[i] != self.buffer[i + 1]:
-        return i + 1
-    return -1
+    return self.buffer.next_change(start)
 
   def throw_last_video(self):
+    """
+    Drops the samples and events of the video played before an abort
+    :return: nothing
+    """
     abortIdx = self.get_abort_event_index()
     if abortIdx >= 0:
       bCIdx = self.get_buffer_change_index(abortIdx + 1)
       #TODO make sure that you do it proportionally to time
       if bCIdx >= 0:
-        self.timeStamps = self.timeStamps[bCIdx:]
-        self.readyStates = self.readyStates[bCIdx:]
-        self.buffer = self.buffer[bCIdx:]
-        self.bufferDurations = self.bufferDurations[bCIdx:]
-        self.currentTimes = self.currentTimes[bCIdx:]
-        self.position = self.position[bCIdx:]
-        self.videoWidths = self.videoWidths[bCIdx:]
-        self.videoHeights = self.videoHeights[bCIdx:]
-        self.videoRates = self.videoRates[bCIdx:]
-        self.resolution = self.resolution[bCIdx:]
-        self.webkitAudioDecodedByteCount = self.webkitAudioDecodedByteCount[bCIdx:]
-        self.webkitVideoDecodedByteCount = self.webkitVideoDecodedByteCount[bCIdx:]
-        self.events = self.events[bCIdx:]
+        self.slice_events(self.timeStamps[bCIdx], None)
+        self.slice_samples(bCIdx)
+
+  def slice_samples(self, start, stop=None):
+    """
+    Restricts every per-sample column to the samples start:stop. Arrays and RangeTables are
+    sliced as views, so in columnar mode this takes constant time and memory; lists are copied.
+    :param start: index of the first sample kept
+    :param stop: index after the last sample kept, None for the end
+    :return: nothing
+    """
+    n = len(self.timeStamps)
+    for name in YoutubeSession.SAMPLE_COLUMNS:
+      # derived columns not computed yet will be from the sliced columns
+      values = self.__dict__.get(name)
+      if values is not None and len(values) == n:
+        setattr(self, name, values[start:stop])
+
+  def slice_events(self, low, high):
+    """
+    Restricts the events to the period [low, high)
+    :param low: relative time of the first event kept, None for no lower bound
+    :param high: relative time after the last event kept, None for no upper bound
+    :return: nothing
+    """
+    start, stop = sample_range(self.eventsTimeStamps, low, high)
+    self.events = self.events[start:stop]
+    self.eventsTimeStamps = self.eventsTimeStamps[start:stop]
+    self.index_events()
+
+  def index_events(self):
+    """
+    Builds the index of the events by code, to be called whenever the events change
+    :return: nothing
+    """
+    self.eventIndex = EventIndex(self.events, self.eventsTimeStamps)
+
+  def first_event(self, code, after=None):
+    """
+    :param code: the event code, e.g. 13 when playback starts
+    :param after: relative time from which events are considered, None for the first event
+    :return: the position of the first event of code at or after time after, -1 if there is none
+    """
+    return self.eventIndex.first_event(code, after)
+
+  def events_between(self, codes, t0=None, t1=None):
+    """
+    :param codes: an event code or a collection of codes
+    :param t0: relative time of the first event, None for no lower bound
+    :param t1: relative time of the end of the period, excluded, None for no upper bound
+    :return: list of the positions of the events of codes in [t0, t1), in order
+    """
+    return self.eventIndex.events_between(codes, t0, t1).tolist()
+
+  def window(self, start_ts, end_ts):
+    """
+    :param start_ts: absolute time of the beginning of the window, on the scale of startTime
+    :param end_ts: absolute time of the end of the window, excluded
+    :return: a copy of the session restricted to the samples, events, bitrate changes and stalls
+    starting in the window. In columnar mode its columns are views of the columns of this session.
+    """
+    low = start_ts - self.startTime
+    high = end_ts - self.startTime
+    session = copy.copy(self)
+    session.slice_samples(*sample_range(self.timeStamps, low, high))
+    session.slice_events(low, high)
+    session.bitrateChanges = self.bitrateChanges.between("ts", low, high)
+    session.stalls = self.stalls.between("start", low, high)
+    session.joinTime = self.joinTime
+    return session
 
 
   def gen_bitrate_changes(self):
     """
-    Goes through the buffering events and builds start and end time windows
+    Goes through the video heights and tracks their changes, which are the boundaries of the
+    runs of the heights. A change on the first sample after the join time is not reported
     :return:
     """
-    started = False
-    for index in range(len(self.videoHeights)):
-      if index == 0:
-        continue
-      if not started and self.timeStamps[index] > self.joinTime:
-        started = True
-        continue
-      if self.videoHeights[index] > self.videoHeights[index - 1]:
-        self.bitrateChanges.append({"ts": self.get_timestamp_by_index(index),
-                                    "direction": "up",
-                                    "previous": self.videoHeights[index - 1],
-                                    "new": self.videoHeights[index]})
-      elif self.videoHeights[index] < self.videoHeights[index - 1]:
-        self.bitrateChanges.append({"ts": self.get_timestamp_by_index(index),
-                                    "direction": "down",
-                                    "previous": self.videoHeights[index - 1],
-                                    "new": self.videoHeights[index]})
+    runs = as_runs(self.videoHeights)
+    started = max(int(np.searchsorted(np.asarray(self.timeStamps), self.joinTime, side='right')), 1)
+    self.bitrateChanges = change_records(value_changes(self.timeStamps, runs, runs.starts != started))
+
+  def get_time_at_resolution(self):
+    """
+    :return: dict of video height -> time spent at that height, from the runs of the heights
+    """
+    runs = as_runs(self.videoHeights)
+    times = {}
+    for value, duration in zip(runs.values.tolist(), runs.run_durations(self.timeStamps).tolist()):
+      times[value] = times.get(value, 0) + duration
+    return times
 
   def gen_empty_buffers(self):
     """
-    Goes through the buffer sizes and returns empty instances
+    Builds the stalls from the events, each one going from a waiting event (22) to the
+    next playing event (13), or to the end of the session
     :return:
     """
-    started = False
-    current_stall = None
-    for index in range(len(self.events)):
-      if not started and self.events[index] == 12:
-        started = True
-        continue
-      elif self.events[index] == 13:
-        if current_stall is not None:
-          # Close current stall
-          current_stall["end"] = self.eventsTimeStamps[index]
-          self.stalls.append(current_stall)
-          current_stall = None
-      elif self.events[index] == 22:
-        if current_stall is None:
-          current_stall = {"start": self.eventsTimeStamps[index],
-                           "end": 0}
-    if current_stall is not None:
-      current_stall["end"] = self.endTime
-      self.stalls.append(current_stall)
+    waiting = self.eventIndex.positions_of(22)
+    playing = self.eventIndex.positions_of(13)
+    # number of playing events before every waiting event, only the first waiting event
+    # after a playing one starts a stall
+    resumed = np.searchsorted(playing, waiting)
+    first = np.ones(len(waiting), dtype=bool)
+    first[1:] = resumed[1:] != resumed[:-1]
+    resumed = resumed[first]
+    times = np.asarray(self.eventsTimeStamps, dtype=np.float64)
+    ends = np.append(times[playing], self.endTime)
+    self.stalls = RecordList(periods(times[waiting[first]], ends[resumed]))
 
   def gen_join_time(self):
     '''
 
     :return:
     '''
-    for index in range(len(self.events)):
-      if self.events[index] == 13:
-        self.joinTime = self.eventsTimeStamps[index]
-        break
+    self.joinTime = 0
+    index = self.eventIndex.first_event(13)
+    if index >= 0:
+      self.joinTime = self.eventsTimeStamps[index]
 
 
   def get_bitrate_changes(self):
@@ -666,4 +730,4 @@ class YoutubeSession:
       for i in range(len(self.videoHeights)):
         if ts >= self.videoHeights[i][0]:
           if i == len(self.videoHeights) - 1 or ts < self.videoHeights[i + 1][0]:
-            return self.videoHeights[i][1]
\ No newline at end of file
+            return self.videoHeights[i][1]